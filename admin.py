@@ -1,10 +1,16 @@
 from fastapi import FastAPI, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text, ForeignKey, or_
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, text, or_
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 from datetime import datetime
 from typing import List, Optional, Dict
+import csv
+import io
+import json
+import re
+from database import create_database_engine, database_url, read_database_url, is_sqlite, WriteQueue
 
 # === SETUP === #
 
@@ -19,9 +25,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-DATABASE_URL = "sqlite:///./rewoven_admin.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+DATABASE_URL = database_url("ADMIN", "sqlite:///./rewoven_admin.db")
+engine = create_database_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Listings, search and exports read through their own pool
+read_engine = create_database_engine(read_database_url("ADMIN", DATABASE_URL), read_only=True)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+# Status changes commit together through one writer
+write_queue = WriteQueue(SessionLocal)
 Base = declarative_base()
 
 # === MODELS === #
@@ -45,8 +56,55 @@ class Order(Base):
 
 Base.metadata.create_all(bind=engine)
 
+# === SEARCH INDEX === #
+
+SEARCH_LIMIT = 20
+
+def setup_user_search():
+    """FTS5 index over user name/email/role, kept in sync by triggers"""
+    with engine.begin() as conn:
+        exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'admin_users_fts'")).first()
+        conn.execute(text("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS admin_users_fts USING fts5(
+                name, email, role, content='admin_users', content_rowid='id', prefix='2 3'
+            )
+        """))
+        conn.execute(text("""
+            CREATE TRIGGER IF NOT EXISTS admin_users_fts_insert AFTER INSERT ON admin_users BEGIN
+                INSERT INTO admin_users_fts(rowid, name, email, role) VALUES (new.id, new.name, new.email, new.role);
+            END
+        """))
+        conn.execute(text("""
+            CREATE TRIGGER IF NOT EXISTS admin_users_fts_delete AFTER DELETE ON admin_users BEGIN
+                INSERT INTO admin_users_fts(admin_users_fts, rowid, name, email, role) VALUES ('delete', old.id, old.name, old.email, old.role);
+            END
+        """))
+        conn.execute(text("""
+            CREATE TRIGGER IF NOT EXISTS admin_users_fts_update AFTER UPDATE OF name, email, role ON admin_users BEGIN
+                INSERT INTO admin_users_fts(admin_users_fts, rowid, name, email, role) VALUES ('delete', old.id, old.name, old.email, old.role);
+                INSERT INTO admin_users_fts(rowid, name, email, role) VALUES (new.id, new.name, new.email, new.role);
+            END
+        """))
+        if not exists:
+            # Index users created before the search index existed
+            conn.execute(text("INSERT INTO admin_users_fts(admin_users_fts) VALUES ('rebuild')"))
+
+if is_sqlite(engine):
+    setup_user_search()
+
+def build_match_query(q: str) -> str:
+    """Turn free text into an FTS5 query where every word is a prefix"""
+    words = re.findall(r"\w+", q.lower())
+    return " ".join(f'"{w}"*' for w in words)
+
 # === UTILS === #
 
+PAGE_LIMIT = 100  # max rows per listing page
+EXPORT_CHUNK_SIZE = 1000  # rows fetched and sent per chunk while exporting
+
+USER_FIELDS = ["id", "name", "email", "role", "details", "created_at"]
+ORDER_FIELDS = ["id", "user_id", "item_id", "status", "created_at"]
+
 def get_db():
     db = SessionLocal()
     try:
@@ -54,22 +112,86 @@ def get_db():
     finally:
         db.close()
 
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def to_dict(row, fields: List[str]) -> Dict:
+    return {field: getattr(row, field) for field in fields}
+
+def to_json_dict(row, fields: List[str]) -> Dict:
+    """to_dict with created_at already in its JSON form"""
+    values = to_dict(row, fields)
+    values["created_at"] = values["created_at"].isoformat() if values["created_at"] else None
+    return values
+
+def paginate(model, fields: List[str], limit: int, cursor: Optional[int], db: Session) -> JSONResponse:
+    """Page a table by id; the next page starts after the X-Next-Cursor header.
+    
+    Selects only `fields` and returns the page as JSON directly, skipping
+    response_model validation of the dicts.
+    """
+    limit = min(max(limit, 1), PAGE_LIMIT)
+    query = db.query(*[getattr(model, field) for field in fields])
+    if cursor is not None:
+        query = query.filter(model.id > cursor)
+    rows = query.order_by(model.id).limit(limit + 1).all()
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = str(rows[-1].id)
+    return JSONResponse([to_json_dict(row, fields) for row in rows], headers=headers)
+
+def stream_export(model, fields: List[str], fmt: str):
+    """Stream every row of a table as NDJSON or CSV, a chunk at a time"""
+    if fmt not in ("ndjson", "csv"):
+        raise HTTPException(400, "Format must be ndjson or csv")
+    
+    def rows():
+        # Own session: the request one is closed before streaming finishes
+        db = ReadSessionLocal()
+        try:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            if fmt == "csv":
+                writer.writerow(fields)
+            
+            query = db.query(model).order_by(model.id).yield_per(EXPORT_CHUNK_SIZE)
+            for count, row in enumerate(query, start=1):
+                values = to_json_dict(row, fields)
+                if fmt == "csv":
+                    writer.writerow(values.values())
+                else:
+                    buffer.write(json.dumps(values) + "\n")
+                
+                if count % EXPORT_CHUNK_SIZE == 0:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue()
+        finally:
+            db.close()
+    
+    media_type = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    filename = f"{model.__tablename__}.{fmt}"
+    return StreamingResponse(
+        rows(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
 # === USERS === #
 
 @app.get("/api/admin/users/", response_model=List[Dict])
-def get_users(db: Session = Depends(get_db)):
-    users = db.query(AdminUser).all()
-    return [
-        {
-            "id": u.id,
-            "name": u.name,
-            "email": u.email,
-            "role": u.role,
-            "details": u.details,
-            "created_at": u.created_at
-        }
-        for u in users
-    ]
+def get_users(limit: int = PAGE_LIMIT, cursor: Optional[int] = None, db: Session = Depends(get_read_db)):
+    return paginate(AdminUser, USER_FIELDS, limit, cursor, db)
+
+@app.get("/api/admin/users/export")
+def export_users(format: str = "ndjson"):
+    return stream_export(AdminUser, USER_FIELDS, format)
 
 @app.post("/api/admin/users/")
 def create_user(user: Dict, db: Session = Depends(get_db)):
@@ -94,37 +216,36 @@ def promote_user(user_id: int, db: Session = Depends(get_db)):
     return {"message": f"{user.name} promoted to Admin"}
 
 @app.get("/api/admin/users/search")
-def search_users(q: str, db: Session = Depends(get_db)):
-    results = db.query(AdminUser).filter(
-        or_(AdminUser.name.ilike(f"%{q}%"), AdminUser.email.ilike(f"%{q}%"), AdminUser.role.ilike(f"%{q}%"))
-    ).all()
-    return [
-        {
-            "id": u.id,
-            "name": u.name,
-            "email": u.email,
-            "role": u.role,
-            "details": u.details,
-            "created_at": u.created_at
-        }
-        for u in results
-    ]
+def search_users(q: str, limit: int = SEARCH_LIMIT, db: Session = Depends(get_read_db)):
+    match = build_match_query(q)
+    if not match:
+        return []
+    limit = min(max(limit, 1), 100)
+    if not is_sqlite(db.get_bind()):
+        # No FTS5: every word must appear in the name, email or role
+        query = db.query(AdminUser)
+        for word in re.findall(r"\w+", q.lower()):
+            query = query.filter(or_(*(field.ilike(f"%{word}%") for field in (AdminUser.name, AdminUser.email, AdminUser.role))))
+        return [to_dict(u, USER_FIELDS) for u in query.order_by(AdminUser.id).limit(limit)]
+    # Best matches first, a hit in the name counts more than one in the email or role
+    results = db.query(AdminUser).from_statement(text("""
+        SELECT admin_users.* FROM admin_users_fts
+        JOIN admin_users ON admin_users.id = admin_users_fts.rowid
+        WHERE admin_users_fts MATCH :match
+        ORDER BY bm25(admin_users_fts, 10.0, 5.0, 1.0)
+        LIMIT :limit
+    """)).params(match=match, limit=limit).all()
+    return [to_dict(u, USER_FIELDS) for u in results]
 
 # === ORDERS === #
 
 @app.get("/api/admin/orders/", response_model=List[Dict])
-def get_orders(db: Session = Depends(get_db)):
-    orders = db.query(Order).all()
-    return [
-        {
-            "id": o.id,
-            "user_id": o.user_id,
-            "item_id": o.item_id,
-            "status": o.status,
-            "created_at": o.created_at
-        }
-        for o in orders
-    ]
+def get_orders(limit: int = PAGE_LIMIT, cursor: Optional[int] = None, db: Session = Depends(get_read_db)):
+    return paginate(Order, ORDER_FIELDS, limit, cursor, db)
+
+@app.get("/api/admin/orders/export")
+def export_orders(format: str = "ndjson"):
+    return stream_export(Order, ORDER_FIELDS, format)
 
 @app.post("/api/admin/orders/")
 def create_order(order: Dict, db: Session = Depends(get_db)):
@@ -134,14 +255,26 @@ def create_order(order: Dict, db: Session = Depends(get_db)):
     return {"message": "Order created successfully"}
 
 @app.patch("/api/admin/orders/{order_id}/status")
-def update_order_status(order_id: int, status: str, db: Session = Depends(get_db)):
-    order = db.query(Order).get(order_id)
-    if not order:
-        raise HTTPException(404, "Order not found")
-    order.status = status
-    db.commit()
+def update_order_status(order_id: int, status: str):
+    def update(db: Session):
+        order = db.query(Order).get(order_id)
+        if not order:
+            raise HTTPException(404, "Order not found")
+        order.status = status
+        return order
+    
+    order = write_queue.run(update)
     return {"message": f"Order #{order.id} status updated to {status}"}
 
+@app.on_event("startup")
+def start_write_queue():
+    write_queue.start()
+
+@app.on_event("shutdown")
+def stop_write_queue():
+    """Commit writes still queued before exiting"""
+    write_queue.stop()
+
 # === HEALTH CHECK === #
 
 @app.get("/health")
@@ -0,0 +1,258 @@
+# Shared database layer for the marketplace, points and admin services
+"""
+Every service builds its engines here, so they all get the same tuning:
+WAL journaling, busy timeouts and a pooled set of connections for SQLite,
+plus an optional read-only pool. Point a service at a server database by
+setting <SERVICE>_DATABASE_URL, e.g. MARKETPLACE_DATABASE_URL.
+"""
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import QueuePool, StaticPool
+from concurrent.futures import Future
+import asyncio
+import copy
+import os
+import queue
+import threading
+import time
+
+# ==================== CONFIG ====================
+
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))  # connections kept open per engine
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))  # extra connections allowed under load
+POOL_TIMEOUT = 30  # seconds to wait for a free connection
+BUSY_TIMEOUT = 10  # seconds a SQLite connection waits for a lock before "database is locked"
+# Extra time a batch waits for more writes; 0 still groups every write that
+# queued up while the previous batch was committing
+GROUP_COMMIT_WINDOW = float(os.getenv("DB_GROUP_COMMIT_MS", "0")) / 1000
+GROUP_COMMIT_MAX = 500  # writes sharing one commit at most
+
+# Applied to every new SQLite connection
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",  # readers and the writer no longer block each other
+    "synchronous": "NORMAL",  # fsync at checkpoints only, safe in WAL mode
+    "busy_timeout": BUSY_TIMEOUT * 1000,
+    "cache_size": -64000,  # 64 MB page cache per connection
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+}
+
+def database_url(service: str, default: str) -> str:
+    """The database URL of a service, from <SERVICE>_DATABASE_URL or `default`"""
+    return os.getenv(f"{service}_DATABASE_URL", default)
+
+def read_database_url(service: str, url: str) -> str:
+    """Where read-only sessions go: <SERVICE>_READ_DATABASE_URL (e.g. a replica) or the primary"""
+    return os.getenv(f"{service}_READ_DATABASE_URL", url)
+
+# ==================== ENGINES ====================
+
+def is_sqlite(bind) -> bool:
+    return bind.dialect.name == "sqlite"
+
+memory_engines = {}  # in-memory URL -> the one engine holding that database
+
+def create_database_engine(url: str, read_only: bool = False) -> Engine:
+    """Engine with pooling and, for SQLite, the pragmas above.
+
+    `read_only` connections refuse writes, so a stray write on a read
+    session fails instead of competing with the writers for the lock.
+    """
+    url = make_url(url)
+    if url.get_backend_name() != "sqlite":
+        engine = create_engine(
+            url, pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW, pool_timeout=POOL_TIMEOUT, pool_pre_ping=True
+        )
+        if read_only:
+            event.listen(engine, "begin", lambda conn: conn.exec_driver_sql("SET TRANSACTION READ ONLY"))
+        return engine
+
+    if url.database in (None, "", ":memory:"):
+        # Every connection and every engine would get its own empty database,
+        # so all threads and the read sessions share a single connection
+        key = str(url)
+        if key not in memory_engines:
+            memory_engines[key] = create_engine(
+                url, connect_args={"check_same_thread": False}, poolclass=StaticPool
+            )
+        return memory_engines[key]
+
+    engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False, "timeout": BUSY_TIMEOUT},
+        poolclass=QueuePool,
+        pool_size=POOL_SIZE,
+        max_overflow=MAX_OVERFLOW,
+        pool_timeout=POOL_TIMEOUT,
+    )
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        if read_only:
+            cursor.execute("PRAGMA query_only = ON")
+        cursor.close()
+
+    return engine
+
+# ==================== DIALECT HELPERS ====================
+
+def begin_snapshot(db):
+    """Make every following read in the session's transaction see one snapshot"""
+    if is_sqlite(db.get_bind()):
+        # pysqlite runs each SELECT in its own read transaction unless one is open
+        db.connection().exec_driver_sql("BEGIN")
+    else:
+        db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+
+def upsert_insert(bind, table):
+    """INSERT supporting on_conflict_do_update/do_nothing on SQLite and PostgreSQL"""
+    if bind.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif is_sqlite(bind):
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"Upserts are not supported on {bind.dialect.name}")
+    return insert(table)
+
+# ==================== WRITE QUEUE ====================
+
+class WriteQueue:
+    """Single writer thread that group-commits the writes of many requests.
+
+    A write is a function taking a session that adds, updates or deletes
+    rows but never commits. The writer runs the writes queued within
+    GROUP_COMMIT_WINDOW in one transaction, each under its own savepoint so
+    a failing write only undoes itself, and commits the batch once. Callers
+    get the write's return value only after that commit, so a write is
+    exactly as durable as if the caller had committed it.
+
+    Sessions come from `session_factory` with expire_on_commit off, so
+    returned ORM objects stay readable after the batch is closed. Side
+    effects that writes queue in `session.info` for after_commit hooks are
+    dropped again when their write is undone.
+    """
+
+    def __init__(self, session_factory, window: float = GROUP_COMMIT_WINDOW, max_batch: int = GROUP_COMMIT_MAX):
+        self.session_factory = session_factory
+        self.window = window
+        self.max_batch = max_batch
+        self._jobs = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        self.batches = 0
+        self.writes = 0
+
+    def submit(self, write) -> Future:
+        """Queue a write, the future resolves once its batch has committed"""
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Write queue is stopped")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                self._thread.start()
+            self._jobs.put((write, future))
+        return future
+
+    def run(self, write):
+        """Queue a write and wait for its commit, for threadpool handlers"""
+        return self.submit(write).result()
+
+    async def run_async(self, write):
+        """Queue a write and await its commit without blocking the event loop"""
+        return await asyncio.wrap_future(self.submit(write))
+
+    def start(self):
+        """Accept writes again after stop(), the writer thread starts with the first one"""
+        with self._lock:
+            self._closed = False
+
+    def stop(self):
+        """Refuse new writes, commit everything already queued, then end the writer thread"""
+        with self._lock:
+            self._closed = True
+            thread, self._thread = self._thread, None
+            if thread is None:
+                return
+            self._jobs.put(None)
+        thread.join()
+
+    def stats(self) -> dict:
+        return {"batches": self.batches, "writes": self.writes}
+
+    def _next_batch(self) -> list:
+        """Block for one write, then gather more until the window closes"""
+        batch = [self._jobs.get()]
+        deadline = time.monotonic() + self.window
+        while batch[-1] is not None and len(batch) < self.max_batch:
+            try:
+                # Writes queued while the previous batch committed are taken right away
+                batch.append(self._jobs.get_nowait())
+            except queue.Empty:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._jobs.get(timeout=timeout))
+                except queue.Empty:
+                    break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            stopping = batch[-1] is None
+            jobs = [job for job in batch if job is not None and job[1].set_running_or_notify_cancel()]
+            if jobs:
+                try:
+                    self._commit(jobs)
+                except Exception as e:
+                    # Opening or closing the session failed; the writer keeps serving later batches
+                    print(f"Error committing write batch: {e}")
+                    for _, future in jobs:
+                        if not future.done():
+                            future.set_exception(e)
+            if stopping:
+                return
+
+    def _commit(self, jobs: list):
+        outcomes = []
+        db = None
+        try:
+            db = self.session_factory(expire_on_commit=False)
+            if is_sqlite(db.get_bind()):
+                # pysqlite only opens a transaction on the first DML, and a
+                # SAVEPOINT outside one would commit on release; this also
+                # takes the write lock up front instead of upgrading later
+                db.connection().exec_driver_sql("BEGIN IMMEDIATE")
+            for write, future in jobs:
+                info = {key: copy.copy(value) for key, value in db.info.items()}
+                try:
+                    with db.begin_nested():
+                        outcomes.append((future, write(db), None))
+                except Exception as e:
+                    db.info.clear()
+                    db.info.update(info)
+                    outcomes.append((future, None, e))
+            db.commit()
+        except Exception as e:
+            for write, future in jobs:
+                future.set_exception(e)
+            if db is not None:
+                db.rollback()
+        else:
+            self.batches += 1
+            self.writes += len(jobs)
+            for future, result, error in outcomes:
+                if error is None:
+                    future.set_result(result)
+                else:
+                    future.set_exception(error)
+        finally:
+            if db is not None:
+                db.close()
@@ -8,20 +8,35 @@ sqlalchemy==2.0.23
 sqlite3 (built-in)
 """
 
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Depends
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Depends, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from sqlalchemy import create_engine, Column, String, Integer, Float, DateTime, Boolean, Text
+from fastapi.responses import FileResponse, JSONResponse
+from fastapi.encoders import jsonable_encoder
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import Column, String, Integer, BigInteger, Float, DateTime, Boolean, Text, ForeignKey, Index, tuple_, bindparam, inspect, text
+from sqlalchemy import table, column, func, literal, literal_column, or_, case, event
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.orm import sessionmaker, Session, object_session
+from sqlalchemy.exc import IntegrityError
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
-from datetime import datetime
+from typing import List, Optional, Dict, Any, NamedTuple, Callable
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
 from PIL import Image
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
+import threading
+import base64
+import hashlib
+import json
+import re
+import time
 import uuid
 import os
-import shutil
 from pathlib import Path
+from database import create_database_engine, database_url, read_database_url, is_sqlite, upsert_insert, WriteQueue
 
 # FastAPI app
 app = FastAPI(title="Simple Marketplace API", version="1.0.0")
@@ -35,10 +50,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Database setup (SQLite for simplicity)
-DATABASE_URL = "sqlite:///./marketplace.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# Database setup (SQLite unless MARKETPLACE_DATABASE_URL says otherwise)
+DATABASE_URL = database_url("MARKETPLACE", "sqlite:///./marketplace.db")
+engine = create_database_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Browsing and search read through their own pool
+read_engine = create_database_engine(read_database_url("MARKETPLACE", DATABASE_URL), read_only=True)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+# Uploads, item creation and points awards commit together through one writer
+write_queue = WriteQueue(SessionLocal)
 Base = declarative_base()
 
 # File upload configuration
@@ -46,9 +66,27 @@ UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
 (UPLOAD_DIR / "images").mkdir(exist_ok=True)
 (UPLOAD_DIR / "thumbnails").mkdir(exist_ok=True)
+(UPLOAD_DIR / "derivatives").mkdir(exist_ok=True)
 
 MAX_FILE_SIZE = 5 * 1024 * 1024  # 5MB
-ALLOWED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
+UPLOAD_CHUNK_SIZE = 64 * 1024  # bytes read per chunk while storing uploads
+MAX_IMAGE_PIXELS = 40_000_000  # reject images that would decode to more than this
+MAX_BATCH_FILES = 10  # files accepted by one batch upload
+
+# Accepted formats, detected from the file contents: PIL format -> stored extension
+IMAGE_FORMATS = {"JPEG": ".jpg", "PNG": ".png", "GIF": ".gif", "WEBP": ".webp"}
+
+# Pillow refuses to open anything larger than twice this (decompression bombs)
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+# Thumbnail worker pool
+THUMBNAIL_WORKERS = os.cpu_count() or 2
+THUMBNAIL_QUEUE_SIZE = THUMBNAIL_WORKERS * 4  # jobs submitted to the pool at once
+
+# On-demand resized images
+MAX_DERIVATIVE_SIZE = 2048  # max requested width/height in pixels
+DERIVATIVE_FORMATS = {"webp": ("WEBP", "image/webp"), "jpeg": ("JPEG", "image/jpeg"), "png": ("PNG", "image/png")}
+DERIVATIVE_CACHE_BYTES = 512 * 1024 * 1024  # 512MB of resized images kept on disk
 
 # Mount static files
 app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
@@ -63,6 +101,20 @@ class ClothingCategory(Base):
     subcategories = Column(Text)  # JSON string
     created_at = Column(DateTime, default=datetime.utcnow)
 
+class ImageBlob(Base):
+    __tablename__ = "image_blobs"
+    
+    # Originals are stored once per distinct content, named by their SHA-256
+    content_hash = Column(String(64), primary_key=True)
+    file_name = Column(String(255), nullable=False)
+    file_size = Column(Integer, nullable=False)
+    width = Column(Integer)
+    height = Column(Integer)
+    thumbnail_path = Column(String(500))
+    thumbnail_status = Column(String(20), default='pending')  # pending/ready/failed
+    ref_count = Column(Integer, default=0)  # ImageMetadata rows using this blob
+    created_at = Column(DateTime, default=datetime.utcnow)
+
 class ImageMetadata(Base):
     __tablename__ = "images"
     
@@ -74,8 +126,10 @@ class ImageMetadata(Base):
     width = Column(Integer)
     height = Column(Integer)
     thumbnail_path = Column(String(500))
+    thumbnail_status = Column(String(20), default='pending', server_default='ready')  # pending/ready/failed
     uploaded_at = Column(DateTime, default=datetime.utcnow)
     uploaded_by = Column(String(100), nullable=False)
+    content_hash = Column(String(64), index=True)  # ImageBlob, NULL for uploads before deduplication
 
 class ClothingItem(Base):
     __tablename__ = "items"
@@ -92,14 +146,284 @@ class ClothingItem(Base):
     color = Column(String(50))
     location = Column(String(200))
     seller_id = Column(String(100), nullable=False)
-    image_ids = Column(Text)  # JSON string of image IDs
+    image_ids = Column(Text)  # JSON string of image IDs, mirrored into item_images
     status = Column(String(20), default='active')
     views = Column(Integer, default=0)
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, onupdate=datetime.utcnow)  # not bumped by view counts
+    
+    # Browse indexes: every listing filters on status, optionally narrows by
+    # category/condition, and pages by (created_at, id) or (price, id)
+    __table_args__ = (
+        Index("ix_items_status_created", "status", "created_at", "id"),
+        Index("ix_items_status_category_created", "status", "category", "created_at", "id"),
+        Index("ix_items_status_category_condition_created", "status", "category", "condition", "created_at", "id"),
+        Index("ix_items_status_condition_created", "status", "condition", "created_at", "id"),
+        Index("ix_items_status_price", "status", "price", "id"),
+        Index("ix_items_status_category_price", "status", "category", "price", "id"),
+    )
+
+class ItemImage(Base):
+    __tablename__ = "item_images"
+    
+    item_id = Column(String(100), ForeignKey("items.item_id"), primary_key=True)
+    position = Column(Integer, primary_key=True)  # order the seller attached the images in
+    image_id = Column(String(100), nullable=False, index=True)  # finds the items showing an image
+    is_primary = Column(Boolean, nullable=False, default=False)  # shown in listings, the first image
+
+class Marker(Base):
+    __tablename__ = "markers"
+    
+    # Progress of background jobs and last-write times that must be shared
+    # across processes and survive a restart
+    name = Column(String(200), primary_key=True)
+    value = Column(BigInteger, nullable=False)
 
 # Create tables
 Base.metadata.create_all(bind=engine)
 
+def upgrade_schema():
+    """Add columns and indexes introduced after a database was first created"""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(engine.dialect)}"
+                if column.server_default is not None:
+                    ddl += f" DEFAULT '{column.server_default.arg}'"
+                conn.execute(text(ddl))
+    
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+upgrade_schema()
+
+def get_marker(db: Session, name: str, default: Optional[int] = None) -> Optional[int]:
+    value = db.query(Marker.value).filter(Marker.name == name).scalar()
+    return default if value is None else value
+
+def set_marker(db: Session, name: str, value: int):
+    """Store a marker in the caller's transaction"""
+    upsert = upsert_insert(db.get_bind(), Marker).values(name=name, value=value)
+    db.execute(upsert.on_conflict_do_update(index_elements=[Marker.name], set_={"value": value}))
+
+def bump_markers(db: Session, names: List[str]):
+    """Set last-write markers to the current time in the caller's transaction"""
+    now = int(time.time() * 1_000_000)
+    upsert = upsert_insert(db.get_bind(), Marker).values([{"name": name, "value": now} for name in names])
+    # Strictly increasing even when clocks of two processes disagree
+    advanced = case((Marker.value >= now, Marker.value + 1), else_=now)
+    db.execute(upsert.on_conflict_do_update(index_elements=[Marker.name], set_={"value": advanced}))
+
+# ==================== SEARCH INDEX ====================
+
+# Only active items are indexed; triggers add, drop and refresh rows as
+# items are created, edited or change status
+ITEM_SEARCH_TRIGGERS = {
+    "items_fts_insert": """
+        CREATE TRIGGER IF NOT EXISTS items_fts_insert AFTER INSERT ON items
+        WHEN new.status = 'active' BEGIN
+            INSERT INTO items_fts(rowid, title, description, brand, color)
+            VALUES (new.id, new.title, new.description, new.brand, new.color);
+        END
+    """,
+    "items_fts_delete": """
+        CREATE TRIGGER IF NOT EXISTS items_fts_delete AFTER DELETE ON items
+        WHEN old.status = 'active' BEGIN
+            INSERT INTO items_fts(items_fts, rowid, title, description, brand, color)
+            VALUES ('delete', old.id, old.title, old.description, old.brand, old.color);
+        END
+    """,
+    "items_fts_unindex": """
+        CREATE TRIGGER IF NOT EXISTS items_fts_unindex AFTER UPDATE OF status, title, description, brand, color ON items
+        WHEN old.status = 'active' BEGIN
+            INSERT INTO items_fts(items_fts, rowid, title, description, brand, color)
+            VALUES ('delete', old.id, old.title, old.description, old.brand, old.color);
+        END
+    """,
+    "items_fts_reindex": """
+        CREATE TRIGGER IF NOT EXISTS items_fts_reindex AFTER UPDATE OF status, title, description, brand, color ON items
+        WHEN new.status = 'active' BEGIN
+            INSERT INTO items_fts(rowid, title, description, brand, color)
+            VALUES (new.id, new.title, new.description, new.brand, new.color);
+        END
+    """,
+}
+
+def setup_item_search():
+    """FTS5 index over the text fields of active items"""
+    with engine.begin() as conn:
+        exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'items_fts'")).first()
+        conn.execute(text("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS items_fts USING fts5(
+                title, description, brand, color, content='items', content_rowid='id', prefix='2 3'
+            )
+        """))
+        for ddl in ITEM_SEARCH_TRIGGERS.values():
+            conn.execute(text(ddl))
+        if not exists:
+            # Index the active catalogue as it was before the search index existed
+            conn.execute(text("""
+                INSERT INTO items_fts(rowid, title, description, brand, color)
+                SELECT id, title, description, brand, color FROM items WHERE status = 'active'
+            """))
+
+if is_sqlite(engine):
+    setup_item_search()
+
+# ==================== ITEM IMAGES ====================
+
+BACKFILL_CHUNK = 500  # items copied into item_images per transaction
+BACKFILL_MARKER = "item_images_backfilled"  # set once every item has been copied
+
+# item_images follows the image_ids JSON of every write, whichever code
+# made it; malformed JSON counts as no images
+ITEM_IMAGE_ROWS = """
+    SELECT {item}.item_id, key, value, key = 0 FROM json_each(
+        CASE WHEN json_valid({item}.image_ids) THEN {item}.image_ids ELSE '[]' END
+    )
+"""
+ITEM_IMAGE_TRIGGERS = {
+    "item_images_insert": f"""
+        CREATE TRIGGER IF NOT EXISTS item_images_insert AFTER INSERT ON items BEGIN
+            INSERT OR IGNORE INTO item_images (item_id, position, image_id, is_primary)
+            {ITEM_IMAGE_ROWS.format(item="new")};
+        END
+    """,
+    "item_images_update": f"""
+        CREATE TRIGGER IF NOT EXISTS item_images_update AFTER UPDATE OF image_ids ON items BEGIN
+            DELETE FROM item_images WHERE item_id = old.item_id;
+            INSERT OR IGNORE INTO item_images (item_id, position, image_id, is_primary)
+            {ITEM_IMAGE_ROWS.format(item="new")};
+        END
+    """,
+    "item_images_delete": """
+        CREATE TRIGGER IF NOT EXISTS item_images_delete AFTER DELETE ON items BEGIN
+            DELETE FROM item_images WHERE item_id = old.item_id;
+        END
+    """,
+}
+
+def setup_item_images():
+    with engine.begin() as conn:
+        for ddl in ITEM_IMAGE_TRIGGERS.values():
+            conn.execute(text(ddl))
+
+def item_image_rows(item_id: str, image_ids: Optional[str]) -> List[Dict[str, Any]]:
+    """item_images rows for an image_ids JSON string, none if it is malformed"""
+    try:
+        ids = json.loads(image_ids or "[]")
+    except ValueError:
+        return []
+    return [
+        {"item_id": item_id, "position": position, "image_id": image_id, "is_primary": position == 0}
+        for position, image_id in enumerate(ids)
+    ]
+
+# Stand-ins for the triggers on databases other than SQLite
+def mirror_item_images(mapper, connection, target):
+    if not inspect(target).attrs.image_ids.history.has_changes():
+        return
+    images = ItemImage.__table__
+    connection.execute(images.delete().where(images.c.item_id == target.item_id))
+    rows = item_image_rows(target.item_id, target.image_ids)
+    if rows:
+        connection.execute(images.insert(), rows)
+
+def drop_item_images(mapper, connection, target):
+    images = ItemImage.__table__
+    connection.execute(images.delete().where(images.c.item_id == target.item_id))
+
+if is_sqlite(engine):
+    setup_item_images()
+else:
+    event.listen(ClothingItem, "after_insert", mirror_item_images)
+    event.listen(ClothingItem, "after_update", mirror_item_images)
+    event.listen(ClothingItem, "before_delete", drop_item_images)
+
+class ItemImageBackfill:
+    """Online copy of the image_ids JSON of items written before item_images existed.
+    
+    Walks the items in id order with one short transaction per chunk, so
+    the API keeps serving while it runs; until it is done, readers fall
+    back to the JSON of items without item_images rows. Items that already
+    have rows are skipped, so a restart before the end simply runs it
+    again; once it finishes, a marker keeps later starts from scanning.
+    """
+
+    def __init__(self, chunk: int = BACKFILL_CHUNK):
+        self.chunk = chunk
+        self.done = False
+        self._thread = None
+
+    def run_chunk(self, after_id: int) -> Optional[int]:
+        """Copy the next chunk of items, returns the last id copied or None at the end"""
+        items = ClothingItem.__table__
+        images = ItemImage.__table__
+        with engine.begin() as conn:
+            chunk = conn.execute(
+                items.select().with_only_columns(items.c.id, items.c.item_id, items.c.image_ids)
+                .where(items.c.id > after_id).order_by(items.c.id).limit(self.chunk)
+            ).all()
+            if not chunk:
+                return None
+            
+            migrated = set(conn.execute(
+                images.select().with_only_columns(images.c.item_id).distinct()
+                .where(images.c.item_id.in_([item.item_id for item in chunk]))
+            ).scalars())
+            rows = [
+                row for item in chunk if item.item_id not in migrated
+                for row in item_image_rows(item.item_id, item.image_ids)
+            ]
+            if rows:
+                # Another process may be backfilling the same chunk
+                conn.execute(upsert_insert(conn, images).on_conflict_do_nothing(), rows)
+        return chunk[-1].id
+
+    def run(self):
+        last_id = 0
+        try:
+            while last_id is not None:
+                last_id = self.run_chunk(last_id)
+            db = SessionLocal()
+            try:
+                set_marker(db, BACKFILL_MARKER, 1)
+                db.commit()
+            finally:
+                db.close()
+        except Exception as e:
+            print(f"Error backfilling item images: {e}")
+            return
+        self.done = True
+
+    def start(self):
+        db = SessionLocal()
+        try:
+            self.done = bool(get_marker(db, BACKFILL_MARKER, 0))
+        finally:
+            db.close()
+        if self.done:
+            return
+        self._thread = threading.Thread(target=self.run, name="item-image-backfill", daemon=True)
+        self._thread.start()
+
+item_image_backfill = ItemImageBackfill()
+
+items_fts = table("items_fts", column("rowid"))
+
+# Searched by the fallback used on databases without FTS5
+SEARCH_FIELDS = (ClothingItem.title, ClothingItem.description, ClothingItem.brand, ClothingItem.color)
+
+def build_match_query(q: str) -> str:
+    """Turn free text into an FTS5 query where every word is a prefix"""
+    words = re.findall(r"\w+", q.lower())
+    return " ".join(f'"{w}"*' for w in words)
+
 # ==================== PYDANTIC MODELS ====================
 
 class CategoryCreate(BaseModel):
@@ -119,6 +443,18 @@ class ImageUploadResponse(BaseModel):
     dimensions: Dict[str, int]
     url: str
     thumbnail_url: str
+    thumbnail_status: str
+
+class BatchUploadResult(BaseModel):
+    original_name: str
+    success: bool
+    image: Optional[ImageUploadResponse] = None
+    error: Optional[str] = None
+
+class BatchUploadResponse(BaseModel):
+    uploaded: int
+    failed: int
+    results: List[BatchUploadResult]
 
 class ItemCreate(BaseModel):
     title: str
@@ -152,6 +488,9 @@ class ItemResponse(BaseModel):
 
 # ==================== HELPER FUNCTIONS ====================
 
+# Sessions are blocking: handlers that only do database work are plain `def`
+# so FastAPI runs them in its threadpool, while `async def` handlers (uploads,
+# image rendering) hand every database call to run_in_threadpool
 def get_db():
     db = SessionLocal()
     try:
@@ -159,32 +498,987 @@ def get_db():
     finally:
         db.close()
 
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
 def validate_file(file: UploadFile) -> bool:
-    """Simple file validation"""
-    if file.size > MAX_FILE_SIZE:
+    """Simple file validation, the contents are checked while storing"""
+    if file.size is not None and file.size > MAX_FILE_SIZE:
         raise HTTPException(status_code=400, detail="File too large (max 5MB)")
     
-    file_ext = Path(file.filename).suffix.lower()
-    if file_ext not in ALLOWED_EXTENSIONS:
-        raise HTTPException(status_code=400, detail="Invalid file format")
-    
     return True
 
+def sniff_format(header: bytes) -> Optional[str]:
+    """Detect the image format from the first bytes of a file"""
+    if header.startswith(b"\xff\xd8\xff"):
+        return "JPEG"
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "PNG"
+    if header[:6] in (b"GIF87a", b"GIF89a"):
+        return "GIF"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "WEBP"
+    return None
+
 def create_thumbnail(image_path: str, thumbnail_path: str, size: tuple = (300, 300)) -> bool:
     """Create a simple thumbnail"""
     try:
         with Image.open(image_path) as img:
+            # JPEGs are decoded at a reduced scale, just above the target size
+            img.draft("RGB", size)
             img.thumbnail(size, Image.Resampling.LANCZOS)
+            if img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
             img.save(thumbnail_path, "JPEG", quality=85)
         return True
     except Exception as e:
         print(f"Error creating thumbnail: {e}")
         return False
 
+def render_derivative(image_path: str, output_path: str, width: int, height: int, fmt: str) -> int:
+    """Resize an image to fit in width x height and return the output size in bytes"""
+    pil_format = DERIVATIVE_FORMATS[fmt][0]
+    with Image.open(image_path) as img:
+        img.draft("RGB", (width, height))
+        img.thumbnail((width, height), Image.Resampling.LANCZOS)
+        if pil_format == "JPEG" and img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        # Write under a temporary name so readers never see a partial file
+        tmp_path = f"{output_path}.{os.getpid()}.tmp"
+        img.save(tmp_path, pil_format, quality=80)
+    os.replace(tmp_path, output_path)
+    return os.path.getsize(output_path)
+
+class StoredUpload(NamedTuple):
+    tmp_path: Path
+    content_hash: str
+    file_size: int
+    file_ext: str
+    width: int
+    height: int
+
+def read_dimensions(image_path: Path, image_format: str) -> tuple:
+    """Read (width, height) from the image header without decoding pixels"""
+    try:
+        with Image.open(image_path) as img:
+            if img.format != image_format:
+                raise HTTPException(status_code=400, detail="Invalid file format")
+            width, height = img.size
+    except Image.DecompressionBombError:
+        raise HTTPException(status_code=400, detail="Image dimensions too large")
+    except (Image.UnidentifiedImageError, OSError, SyntaxError):
+        raise HTTPException(status_code=400, detail="Invalid or corrupt image")
+    
+    if width * height > MAX_IMAGE_PIXELS:
+        raise HTTPException(status_code=400, detail="Image dimensions too large")
+    return width, height
+
+def store_upload(source) -> StoredUpload:
+    """Stream an upload to a temporary file, hashing and checking it on the way.
+    
+    Aborts as soon as MAX_FILE_SIZE is crossed or the first bytes are not a
+    supported image format.
+    """
+    digest = hashlib.sha256()
+    file_size = 0
+    image_format = None
+    tmp_path = UPLOAD_DIR / "images" / f"{uuid.uuid4()}.tmp"
+    try:
+        with open(tmp_path, "wb") as buffer:
+            while chunk := source.read(UPLOAD_CHUNK_SIZE):
+                if image_format is None:
+                    image_format = sniff_format(chunk[:16])
+                    if image_format is None:
+                        raise HTTPException(status_code=400, detail="Invalid file format")
+                file_size += len(chunk)
+                if file_size > MAX_FILE_SIZE:
+                    raise HTTPException(status_code=400, detail="File too large (max 5MB)")
+                digest.update(chunk)
+                buffer.write(chunk)
+        
+        if image_format is None:
+            raise HTTPException(status_code=400, detail="Empty file")
+        width, height = read_dimensions(tmp_path, image_format)
+    except Exception:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    
+    return StoredUpload(tmp_path, digest.hexdigest(), file_size, IMAGE_FORMATS[image_format], width, height)
+
+def claim_blob(db: Session, upload: StoredUpload) -> tuple:
+    """Take a reference on the blob for an upload, storing it if the content is new.
+    
+    Returns (blob, created). The caller commits.
+    """
+    content_hash = upload.content_hash
+    blob = db.get(ImageBlob, content_hash)
+    if blob is None:
+        file_name = f"{content_hash}{upload.file_ext}"
+        os.replace(upload.tmp_path, UPLOAD_DIR / "images" / file_name)
+        
+        blob = ImageBlob(
+            content_hash=content_hash,
+            file_name=file_name,
+            file_size=upload.file_size,
+            width=upload.width,
+            height=upload.height,
+            thumbnail_path=f"{content_hash}_thumb.jpg",
+            thumbnail_status="pending",
+            ref_count=1
+        )
+        try:
+            # Savepoint, so losing the race does not undo the caller's other rows
+            with db.begin_nested():
+                db.add(blob)
+            return blob, True
+        except IntegrityError:
+            # The same content was stored by a concurrent upload
+            blob = db.get(ImageBlob, content_hash)
+    else:
+        upload.tmp_path.unlink(missing_ok=True)
+    
+    db.query(ImageBlob).filter(ImageBlob.content_hash == content_hash).update(
+        {"ref_count": ImageBlob.ref_count + 1}
+    )
+    return blob, False
+
+# Run as hook(db, image) for every recorded upload, in the upload's own transaction
+upload_hooks: List[Callable[[Session, "ImageMetadata"], None]] = []
+
+def record_upload(db: Session, upload: StoredUpload, original_name: str, user_id: str) -> tuple:
+    """Add the ImageMetadata row for a stored upload.
+    
+    Returns (image, created) where created tells whether the content is new
+    and needs a thumbnail. The caller commits.
+    """
+    blob, created = claim_blob(db, upload)
+    db_image = ImageMetadata(
+        image_id=str(uuid.uuid4()),
+        original_name=original_name,
+        file_name=blob.file_name,
+        file_size=blob.file_size,
+        width=blob.width,
+        height=blob.height,
+        thumbnail_path=blob.thumbnail_path,
+        thumbnail_status=blob.thumbnail_status,
+        uploaded_by=user_id,
+        content_hash=upload.content_hash
+    )
+    db.add(db_image)
+    for hook in upload_hooks:
+        hook(db, db_image)
+    return db_image, created
+
+def discard_upload(db: Session, upload: StoredUpload):
+    """Remove the files of a stored upload whose record was rolled back.
+    
+    Runs as a write, so no other upload can claim the blob between the
+    check and the unlink.
+    """
+    upload.tmp_path.unlink(missing_ok=True)
+    if db.get(ImageBlob, upload.content_hash) is None:
+        (UPLOAD_DIR / "images" / f"{upload.content_hash}{upload.file_ext}").unlink(missing_ok=True)
+
+async def commit_upload(upload: StoredUpload, original_name: str, user_id: str) -> tuple:
+    """Record a stored upload through the write queue, discarding its files if that fails"""
+    try:
+        return await write_queue.run_async(lambda db: record_upload(db, upload, original_name, user_id))
+    except Exception:
+        try:
+            await write_queue.run_async(lambda db: discard_upload(db, upload))
+        except Exception as e:
+            print(f"Error discarding upload: {e}")
+        raise
+
+def build_upload_response(db_image: ImageMetadata) -> ImageUploadResponse:
+    return ImageUploadResponse(
+        image_id=db_image.image_id,
+        original_name=db_image.original_name,
+        file_size=db_image.file_size,
+        dimensions={"width": db_image.width, "height": db_image.height},
+        url=f"/uploads/images/{db_image.file_name}",
+        thumbnail_url=f"/uploads/thumbnails/{db_image.thumbnail_path}",
+        thumbnail_status=db_image.thumbnail_status
+    )
+
+# ==================== THUMBNAIL WORKERS ====================
+
+thumbnail_pool: Optional[ProcessPoolExecutor] = None
+thumbnail_slots = asyncio.Semaphore(THUMBNAIL_QUEUE_SIZE)
+thumbnail_tasks = set()
+
+def set_thumbnail_status(thumbnail_name: str, status: str):
+    """Record the outcome for every image sharing the thumbnail"""
+    db = SessionLocal()
+    try:
+        images = db.query(ImageMetadata).filter(ImageMetadata.thumbnail_path == thumbnail_name)
+        image_ids = [image_id for (image_id,) in images.with_entities(ImageMetadata.image_id)]
+        images.update({"thumbnail_status": status})
+        db.query(ImageBlob).filter(ImageBlob.thumbnail_path == thumbnail_name).update(
+            {"thumbnail_status": status}
+        )
+        if image_ids:
+            invalidate_image_users(db, image_ids)
+        db.commit()
+    finally:
+        db.close()
+    for image_id in image_ids:
+        image_cache.invalidate(image_id)
+
+async def generate_thumbnail(image_path: str, thumbnail_name: str):
+    """Render a thumbnail in the worker pool and record the outcome"""
+    thumbnail_path = str(UPLOAD_DIR / "thumbnails" / thumbnail_name)
+    async with thumbnail_slots:
+        loop = asyncio.get_running_loop()
+        try:
+            ok = await loop.run_in_executor(thumbnail_pool, create_thumbnail, image_path, thumbnail_path)
+        except Exception as e:
+            print(f"Error creating thumbnail: {e}")
+            ok = False
+    await run_in_threadpool(set_thumbnail_status, thumbnail_name, "ready" if ok else "failed")
+
+def schedule_thumbnail(image_path: str, thumbnail_name: str):
+    """Queue thumbnail generation without waiting for it"""
+    task = asyncio.create_task(generate_thumbnail(image_path, thumbnail_name))
+    thumbnail_tasks.add(task)
+    task.add_done_callback(thumbnail_tasks.discard)
+
+# ==================== DERIVATIVE CACHE ====================
+
+class DerivativeCache:
+    """Size-bounded LRU of resized images on disk.
+    
+    Concurrent requests for the same variant share a single render.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int = DERIVATIVE_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._files: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        self._rendering: Dict[str, asyncio.Future] = {}
+
+    def load(self):
+        """Index files left on disk by a previous run, oldest first"""
+        self._files.clear()
+        self._total_bytes = 0
+        entries = sorted(self.directory.iterdir(), key=lambda p: p.stat().st_mtime)
+        for path in entries:
+            if path.suffix == ".tmp":
+                path.unlink(missing_ok=True)
+                continue
+            self._add(path.name, path.stat().st_size)
+        self._evict()
+
+    def _add(self, name: str, size: int):
+        self._total_bytes += size - self._files.get(name, 0)
+        self._files[name] = size
+        self._files.move_to_end(name)
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and self._files:
+            name, size = self._files.popitem(last=False)
+            self._total_bytes -= size
+            (self.directory / name).unlink(missing_ok=True)
+
+    async def _render(self, name: str, path: Path, render) -> Path:
+        try:
+            size = await render(path)
+            self._add(name, size)
+            self._evict()
+            return path
+        finally:
+            del self._rendering[name]
+
+    async def get(self, name: str, render) -> Path:
+        """Return the cached file, calling `render(path) -> size` on a miss"""
+        path = self.directory / name
+        if name in self._files and path.exists():
+            self._files.move_to_end(name)
+            return path
+        
+        pending = self._rendering.get(name)
+        if pending is None:
+            # A task of its own, so a cancelled request does not abort the render its waiters share
+            pending = asyncio.ensure_future(self._render(name, path, render))
+            self._rendering[name] = pending
+        return await asyncio.shield(pending)
+
+derivative_cache = DerivativeCache(UPLOAD_DIR / "derivatives")
+
+# ==================== HTTP CACHING ====================
+
+# Cache-Control sent by each cacheable route, keyed by route path
+CACHE_CONTROL = {
+    "/api/categories/": "no-cache",
+    "/api/items/{item_id}": "public, no-cache",
+    "/api/items/": "public, max-age=10",
+}
+ITEM_VERSION_CACHE_SIZE = 100000  # max item validators kept in memory
+ITEM_VERSION_TTL = 5  # seconds an item's validators are trusted without a query; bounds how long another process's write goes unseen
+CATALOGUE_MARKER = "catalogue"  # last-write marker of the list pages, "catalogue:<category>" per category
+CATALOGUE_ALL = "*"  # marker category of writes that may touch every category
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Whether the client's If-None-Match already covers `etag`"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # Weak comparison, as required for If-None-Match
+    candidates = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return etag.removeprefix("W/") in candidates
+
+def is_not_modified(request: Request, etag: str, last_modified: datetime) -> bool:
+    """Evaluate If-None-Match, or If-Modified-Since when no ETag was sent"""
+    if request.headers.get("if-none-match"):
+        return etag_matches(request, etag)
+    since = request.headers.get("if-modified-since")
+    if not since:
+        return False
+    try:
+        since = parsedate_to_datetime(since)
+    except (TypeError, ValueError, IndexError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    return last_modified.replace(microsecond=0, tzinfo=timezone.utc) <= since
+
+def cache_headers(route: str, etag: str, last_modified: Optional[datetime] = None) -> Dict[str, str]:
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL[route]}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(
+            last_modified.replace(microsecond=0, tzinfo=timezone.utc), usegmt=True
+        )
+    return headers
+
+class ContentVersions:
+    """Validators for item responses that can be checked without a query.
+    
+    Entries hold the (etag, last_modified) of the last response built for an
+    item. Writes committed by this process drop them at once; a write from
+    another process is only seen once the entry expires. View counts are
+    left out, which is why the ETags are weak.
+    """
+
+    def __init__(self, max_items: int = ITEM_VERSION_CACHE_SIZE, ttl: float = ITEM_VERSION_TTL):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.generation = 0
+        self._items: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def item(self, item_id: str) -> Optional[tuple]:
+        """Return the (etag, last_modified) of an item unless they have expired"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._items.get(item_id)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._items[item_id]
+                return None
+            self._items.move_to_end(item_id)
+            return entry[1], entry[2]
+
+    def remember(self, item_id: str, etag: str, last_modified: datetime, generation: int):
+        """Store an item's validators unless it was written since `generation`"""
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._items[item_id] = (time.monotonic() + self.ttl, etag, last_modified)
+            self._items.move_to_end(item_id)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def touch(self, item_ids):
+        """Record a write to the given items"""
+        with self._lock:
+            for item_id in item_ids:
+                self._items.pop(item_id, None)
+            self.generation += 1
+
+    def touch_all(self):
+        with self._lock:
+            self._items.clear()
+            self.generation += 1
+
+content_versions = ContentVersions()
+
+def catalogue_marker(category: Optional[str] = None) -> str:
+    return CATALOGUE_MARKER if category is None else f"{CATALOGUE_MARKER}:{category}"
+
+def bump_catalogue(db: Session, categories):
+    """Advance the last-write markers of the catalogue and of `categories` in the caller's transaction.
+    
+    Pass CATALOGUE_ALL among `categories` when the write may touch any of them.
+    """
+    bump_markers(db, [catalogue_marker(), *(catalogue_marker(category) for category in sorted(categories))])
+
+def catalogue_version(db: Session, category: Optional[str] = None) -> tuple:
+    """The (version, last_modified) of the list pages filtered to `category`, or of all pages"""
+    if category is None:
+        value = get_marker(db, catalogue_marker(), 0)
+        return str(value), datetime.utcfromtimestamp(value / 1_000_000)
+    
+    names = [catalogue_marker(category), catalogue_marker(CATALOGUE_ALL)]
+    values = dict(db.query(Marker.name, Marker.value).filter(Marker.name.in_(names)))
+    value, everything = (values.get(name, 0) for name in names)
+    return f"{value}.{everything}", datetime.utcfromtimestamp(max(value, everything) / 1_000_000)
+
+@event.listens_for(ClothingItem, "after_insert")
+@event.listens_for(ClothingItem, "after_update")
+@event.listens_for(ClothingItem, "after_delete")
+def queue_item_invalidation(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault("touched_items", set()).add(target.item_id)
+        # An item moved to another category leaves the old category's pages too
+        history = inspect(target).attrs.category.history
+        categories = session.info.setdefault("touched_categories", set())
+        categories.update([target.category, *history.deleted])
+
+@event.listens_for(SessionLocal, "before_commit")
+def record_item_invalidation(session):
+    # Other processes learn of the write from the markers it commits
+    if session.in_nested_transaction():
+        return
+    session.flush()
+    if session.info.get("touched_all"):
+        bump_catalogue(session, {CATALOGUE_ALL})
+    elif session.info.get("touched_items"):
+        bump_catalogue(session, session.info.get("touched_categories", set()))
+
+@event.listens_for(SessionLocal, "after_commit")
+def apply_item_invalidation(session):
+    # Releasing a savepoint fires after_commit too; wait for the real commit
+    if session.in_nested_transaction():
+        return
+    touched = session.info.pop("touched_items", None)
+    if session.info.pop("touched_all", False):
+        content_versions.touch_all()
+        list_page_cache.clear()
+    elif touched:
+        content_versions.touch(touched)
+        list_page_cache.invalidate(session.info.pop("touched_categories", set()))
+    session.info.pop("touched_categories", None)
+
+@event.listens_for(SessionLocal, "after_rollback")
+def discard_item_invalidation(session):
+    # A savepoint rolling back leaves the rest of the transaction standing
+    if session.in_nested_transaction():
+        return
+    session.info.pop("touched_items", None)
+    session.info.pop("touched_categories", None)
+    session.info.pop("touched_all", None)
+
+def item_etag(item: Dict[str, Any]) -> str:
+    payload = json.dumps({k: v for k, v in item.items() if k != "views"})
+    return f'W/"{hashlib.sha256(payload.encode()).hexdigest()[:32]}"'
+
+def list_etag(version: str, params: tuple) -> str:
+    payload = json.dumps([version, *params], default=str)
+    return f'W/"{hashlib.sha256(payload.encode()).hexdigest()[:32]}"'
+
+# ==================== LIST PAGE CACHE ====================
+
+LIST_CACHE_SIZE = 1000  # max serialized list pages kept in memory
+LIST_CACHE_TTL = 10  # seconds a page is served from memory; bounds how stale its view counts get
+
+class ListPageCache:
+    """LRU/TTL cache of serialized get_items pages, keyed by their parameters.
+    
+    A committed item write drops the pages of the item's category and the
+    pages without a category filter; other categories stay cached. Pages
+    also carry the catalogue version they were built under, so a write
+    committed by another process makes them miss.
+    """
+
+    def __init__(self, max_pages: int = LIST_CACHE_SIZE, ttl: float = LIST_CACHE_TTL):
+        self.max_pages = max_pages
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+        self._pages: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple, version: str) -> Optional[tuple]:
+        """Return (body, next_cursor) of a cached page that has not expired or been rewritten"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._pages.get(key)
+            if entry is None or entry[0] <= now or entry[1] != version:
+                if entry is not None:
+                    del self._pages[key]
+                self.misses += 1
+                return None
+            self._pages.move_to_end(key)
+            self.hits += 1
+            return entry[2], entry[3]
+
+    def put(self, key: tuple, version: str, body: bytes, next_cursor: Optional[str], generation: int):
+        """Cache a page unless an invalidation happened since `generation`"""
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._pages[key] = (time.monotonic() + self.ttl, version, body, next_cursor)
+            self._pages.move_to_end(key)
+            while len(self._pages) > self.max_pages:
+                self._pages.popitem(last=False)
+
+    def invalidate(self, categories):
+        """Drop every page that could list an item from `categories`"""
+        with self._lock:
+            self.generation += 1
+            stale = [key for key in self._pages if key[0] is None or key[0] in categories]
+            for key in stale:
+                del self._pages[key]
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._pages.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"pages": len(self._pages), "hits": self.hits, "misses": self.misses}
+
+list_page_cache = ListPageCache()
+
+# ==================== CATEGORY CATALOGUE ====================
+
+CATEGORIES_MARKER = "categories"  # last-write marker of the category list
+
+def category_response(cat: ClothingCategory) -> CategoryResponse:
+    return CategoryResponse(
+        id=cat.id,
+        name=cat.name,
+        subcategories=json.loads(cat.subcategories or "[]"),
+        created_at=cat.created_at
+    )
+
+class CategoryCatalogue:
+    """The serialized category list, rebuilt only after a category is created.
+    
+    The list is kept along with the categories marker it was read under, so
+    a category created by another process is picked up on the next request.
+    """
+
+    def __init__(self):
+        self.generation = 0
+        self._version: Optional[int] = None
+        self._body: Optional[bytes] = None
+        self._etag: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self.generation += 1
+            self._body = self._etag = None
+
+    def get(self) -> tuple:
+        """Return (body, etag), querying the categories only after they were written"""
+        db = ReadSessionLocal()
+        try:
+            version = get_marker(db, CATEGORIES_MARKER, 0)
+            with self._lock:
+                if self._body is not None and self._version == version:
+                    return self._body, self._etag
+                generation = self.generation
+            categories = [category_response(cat) for cat in db.query(ClothingCategory).all()]
+        finally:
+            db.close()
+        
+        # Same bytes FastAPI would produce for List[CategoryResponse]
+        body = JSONResponse(jsonable_encoder(categories)).body
+        etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        with self._lock:
+            # A category created during the query leaves this list stale
+            if generation == self.generation:
+                self._version, self._body, self._etag = version, body, etag
+        return body, etag
+
+category_catalogue = CategoryCatalogue()
+
+# ==================== PAGINATION ====================
+
+ITEM_PAGE_LIMIT = 100  # max items per listing page
+
+# sort name -> (columns, descending)
+ITEM_SORTS = {
+    "newest": ((ClothingItem.created_at, ClothingItem.id), True),
+    "price_asc": ((ClothingItem.price, ClothingItem.id), False),
+    "price_desc": ((ClothingItem.price, ClothingItem.id), True),
+}
+
+def encode_cursor(sort: str, key, last_id: int) -> str:
+    """Opaque cursor pointing just after the row (key, last_id) in the given sort order"""
+    if isinstance(key, datetime):
+        key = key.isoformat()
+    raw = json.dumps([sort, key, last_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str, sort: str) -> tuple:
+    """Decode a cursor produced by encode_cursor for the same sort order"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_sort, key, last_id = json.loads(base64.urlsafe_b64decode(padded))
+        if cursor_sort != sort:
+            raise ValueError("sort mismatch")
+        # Datetime keys are the only ones encoded as strings
+        if isinstance(key, str):
+            key = datetime.fromisoformat(key)
+        else:
+            key = float(key)
+        return key, int(last_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def apply_item_filters(query, category: Optional[str], condition: Optional[str],
+                       min_price: Optional[float], max_price: Optional[float]):
+    """Restrict a ClothingItem query to active items matching the browse filters"""
+    query = query.filter(ClothingItem.status == 'active')
+    
+    if category:
+        query = query.filter(ClothingItem.category == category)
+    if condition:
+        query = query.filter(ClothingItem.condition == condition)
+    if min_price is not None:
+        query = query.filter(ClothingItem.price >= min_price)
+    if max_price is not None:
+        query = query.filter(ClothingItem.price <= max_price)
+    return query
+
+def apply_keyset(query, sort: str, cursor: Optional[str]):
+    """Order a ClothingItem query by `sort` and seek past `cursor`"""
+    if sort not in ITEM_SORTS:
+        raise HTTPException(status_code=400, detail=f"Invalid sort, use one of: {', '.join(ITEM_SORTS)}")
+    columns, descending = ITEM_SORTS[sort]
+    
+    if cursor:
+        key, last_id = decode_cursor(cursor, sort)
+        position = tuple_(*columns)
+        if descending:
+            query = query.filter(position < tuple_(key, last_id))
+        else:
+            query = query.filter(position > tuple_(key, last_id))
+    
+    if descending:
+        return query.order_by(*(c.desc() for c in columns))
+    return query.order_by(*columns)
+
+# ==================== VIEW COUNTER ====================
+
+VIEW_FLUSH_INTERVAL = 5  # seconds between writes of pending view counts
+VIEW_FLUSH_THRESHOLD = 1000  # pending views that trigger an early write
+
+class ViewCounter:
+    """Write-behind accumulator for item views.
+    
+    Reads only bump an in-memory counter; a background thread writes the
+    accumulated deltas back with one bulk UPDATE per flush.
+    """
+
+    def __init__(self, interval: float = VIEW_FLUSH_INTERVAL, threshold: int = VIEW_FLUSH_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self._pending: Dict[str, int] = {}
+        self._flushing: Dict[str, int] = {}
+        self._pending_total = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def record(self, item_id: str) -> int:
+        """Count one view and return the views not yet written for the item"""
+        with self._lock:
+            self._pending[item_id] = self._pending.get(item_id, 0) + 1
+            self._pending_total += 1
+            if self._pending_total >= self.threshold:
+                self._wakeup.set()
+            return self._pending[item_id] + self._flushing.get(item_id, 0)
+
+    def pending(self, item_id: str) -> int:
+        """Views recorded for the item that are not yet in the database"""
+        with self._lock:
+            return self._pending.get(item_id, 0) + self._flushing.get(item_id, 0)
+
+    def flush(self) -> int:
+        """Write all pending views in one bulk UPDATE, returns items updated"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending, self._pending_total = self._pending, {}, 0
+                self._flushing = batch
+            if not batch:
+                return 0
+            
+            items = ClothingItem.__table__
+            stmt = items.update().where(
+                items.c.item_id == bindparam("b_item_id")
+            ).values(views=items.c.views + bindparam("b_delta"), updated_at=items.c.updated_at)
+            
+            db = SessionLocal()
+            try:
+                db.execute(stmt, [{"b_item_id": k, "b_delta": v} for k, v in batch.items()])
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                print(f"Error flushing view counts: {e}")
+                # Keep the views so the next flush retries them
+                with self._lock:
+                    for item_id, delta in batch.items():
+                        self._pending[item_id] = self._pending.get(item_id, 0) + delta
+                        self._pending_total += delta
+                return 0
+            finally:
+                with self._lock:
+                    self._flushing = {}
+                db.close()
+            return len(batch)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="view-counter", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread and write whatever is still pending"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+view_counter = ViewCounter()
+
+# ==================== IMAGE HYDRATION ====================
+
+IMAGE_CACHE_SIZE = 10000  # max ImageMetadata entries kept in memory
+
+class ImageCache:
+    """In-process LRU cache of image payloads keyed by image_id.
+
+    The thumbnail status is the only field that changes after upload, and
+    only while it is pending. Pending images are not cached, and
+    set_thumbnail_status drops the entries of the images it finishes.
+    """
+
+    def __init__(self, max_size: int = IMAGE_CACHE_SIZE):
+        self.max_size = max_size
+        self.generation = 0
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, image_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        found = {}
+        with self._lock:
+            for image_id in image_ids:
+                entry = self._entries.get(image_id)
+                if entry is not None:
+                    self._entries.move_to_end(image_id)
+                    found[image_id] = entry
+        return found
+
+    def put_many(self, entries: Dict[str, Dict[str, Any]], generation: int):
+        """Cache finished images unless an invalidation happened since `generation`"""
+        with self._lock:
+            if generation != self.generation:
+                return
+            for image_id, entry in entries.items():
+                if entry["thumbnail_status"] == "pending":
+                    continue
+                self._entries[image_id] = entry
+                self._entries.move_to_end(image_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, image_id: str):
+        with self._lock:
+            self.generation += 1
+            self._entries.pop(image_id, None)
+
+image_cache = ImageCache()
+
+def image_payload(img: ImageMetadata) -> Dict[str, Any]:
+    """Public representation of an image attached to an item"""
+    return {
+        "image_id": img.image_id,
+        "url": f"/uploads/images/{img.file_name}",
+        "thumbnail_url": f"/uploads/thumbnails/{img.thumbnail_path}",
+        "thumbnail_status": img.thumbnail_status,
+        "dimensions": {"width": img.width, "height": img.height}
+    }
+
+def hydrate_images(db: Session, image_id_lists: List[List[str]]) -> List[List[Dict[str, Any]]]:
+    """Resolve the image IDs of a whole page of items with at most one query.
+
+    Takes one list of image IDs per item and returns the matching image
+    payloads per item, in the order they were referenced. Unknown IDs are
+    skipped.
+    """
+    wanted = list(dict.fromkeys(i for ids in image_id_lists for i in ids))
+    if not wanted:
+        return [[] for _ in image_id_lists]
+
+    resolved = image_cache.get_many(wanted)
+    missing = [i for i in wanted if i not in resolved]
+    if missing:
+        generation = image_cache.generation
+        db_images = db.query(ImageMetadata).filter(
+            ImageMetadata.image_id.in_(missing)
+        ).all()
+        loaded = {img.image_id: image_payload(img) for img in db_images}
+        image_cache.put_many(loaded, generation)
+        resolved.update(loaded)
+
+    return [[resolved[i] for i in ids if i in resolved] for ids in image_id_lists]
+
+# Columns read for item responses; selecting them skips building ORM objects
+ITEM_FIELDS = (
+    "id", "item_id", "title", "description", "price", "category", "condition", "brand", "size",
+    "color", "location", "seller_id", "status", "views", "created_at", "updated_at", "image_ids"
+)
+ITEM_COLUMNS = tuple(getattr(ClothingItem, field) for field in ITEM_FIELDS)
+
+def item_row(item: ClothingItem) -> tuple:
+    """The ITEM_COLUMNS row of an item object"""
+    return tuple(getattr(item, field) for field in ITEM_FIELDS)
+
+def item_payload(row: tuple, images: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """JSON-ready ItemResponse for a row starting with ITEM_COLUMNS, including unwritten views.
+    
+    Matches the ItemResponse serialization field for field, so responses
+    built from it can skip model validation.
+    """
+    (id, item_id, title, description, price, category, condition, brand, size,
+     color, location, seller_id, status, views, created_at, *_) = row
+    return {
+        "id": id,
+        "item_id": item_id,
+        "title": title,
+        "description": description,
+        "price": float(price),
+        "category": category,
+        "condition": condition,
+        "brand": brand,
+        "size": size,
+        "color": color,
+        "location": location,
+        "seller_id": seller_id,
+        "status": status,
+        "views": (views or 0) + view_counter.pending(item_id),
+        "created_at": created_at.isoformat(),
+        "images": images
+    }
+
+def build_item_page(db: Session, params: tuple) -> tuple:
+    """Query and serialize one get_items page, returns (body, next_cursor)"""
+    category, condition, min_price, max_price, sort, cursor, skip, limit = params
+    
+    query = apply_item_filters(item_image_query(db, primary_only=True), category, condition, min_price, max_price)
+    query = apply_keyset(query, sort, cursor)
+    if skip:
+        query = query.offset(skip)
+    
+    # Fetch one extra row to know whether there is a next page
+    next_cursor = None
+    items = query.limit(limit + 1).all()
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        key = last.created_at if sort == "newest" else last.price
+        next_cursor = encode_cursor(sort, key, last.id)
+    
+    # Only the primary image is shown in listings, it came with the page
+    page_images = primary_images(db, items)
+    
+    page = [item_payload(item, images) for item, images in zip(items, page_images)]
+    # Same bytes FastAPI would produce for List[ItemResponse]
+    return JSONResponse(page).body, next_cursor
+
+# ==================== ITEM IMAGE READS ====================
+
+IMAGE_FIELDS = ("image_id", "file_name", "thumbnail_path", "thumbnail_status", "width", "height")
+IMAGE_COLUMNS = tuple(getattr(ImageMetadata, field) for field in IMAGE_FIELDS)
+# Where the image columns sit in rows from item_image_query
+IMAGE_SLICE = slice(len(ITEM_COLUMNS), len(ITEM_COLUMNS) + len(IMAGE_COLUMNS))
+
+class ImageRow(NamedTuple):
+    image_id: str
+    file_name: str
+    thumbnail_path: str
+    thumbnail_status: str
+    width: int
+    height: int
+
+def item_image_query(db: Session, *extra, primary_only: bool = False):
+    """Items joined with their images: one row per image, or per item with `primary_only`.
+    
+    Rows hold ITEM_COLUMNS, then IMAGE_COLUMNS (NULL when the item has no
+    image or it was deleted), then `extra`.
+    """
+    on = ItemImage.item_id == ClothingItem.item_id
+    if primary_only:
+        on &= ItemImage.is_primary
+    return db.query(*ITEM_COLUMNS, *IMAGE_COLUMNS, *extra).outerjoin(ItemImage, on).outerjoin(
+        ImageMetadata, ImageMetadata.image_id == ItemImage.image_id
+    )
+
+def is_legacy(row, images: list) -> bool:
+    """Whether the item may have images the backfill has not copied yet"""
+    return not images and not item_image_backfill.done and row.image_ids not in (None, "", "[]")
+
+def primary_images(db: Session, rows: list) -> List[List[Dict[str, Any]]]:
+    """Primary image payload per item from `primary_only` item_image_query rows"""
+    page_images = [
+        [image_payload(ImageRow(*row[IMAGE_SLICE]))] if row[IMAGE_SLICE.start] else [] for row in rows
+    ]
+    legacy = [i for i, row in enumerate(rows) if is_legacy(row, page_images[i])]
+    if legacy:
+        resolved = hydrate_images(db, [json.loads(rows[i].image_ids)[:1] for i in legacy])
+        for i, images in zip(legacy, resolved):
+            page_images[i] = images
+    return page_images
+
+def item_images(db: Session, rows: list) -> List[Dict[str, Any]]:
+    """Image payloads of one item from its item_image_query rows, in position order"""
+    images = [image_payload(ImageRow(*row[IMAGE_SLICE])) for row in rows if row[IMAGE_SLICE.start]]
+    if is_legacy(rows[0], images):
+        return hydrate_images(db, [json.loads(rows[0].image_ids)])[0]
+    return images
+
+def invalidate_image_users(db: Session, image_ids: List[str]):
+    """Invalidate every item showing one of `image_ids` when the caller's transaction commits"""
+    if not item_image_backfill.done:
+        # Not every item is in item_images yet; invalidate them all without looking them up
+        db.info["touched_all"] = True
+        return
+    
+    users = db.query(ClothingItem.item_id, ClothingItem.category).join(
+        ItemImage, ItemImage.item_id == ClothingItem.item_id
+    ).filter(ItemImage.image_id.in_(image_ids)).distinct().all()
+    if users:
+        db.info.setdefault("touched_items", set()).update(item_id for item_id, _ in users)
+        db.info.setdefault("touched_categories", set()).update(category for _, category in users)
+
 # ==================== API ENDPOINTS ====================
 
 @app.post("/api/categories/", response_model=CategoryResponse)
-async def create_category(category: CategoryCreate, db: Session = Depends(get_db)):
+def create_category(category: CategoryCreate, db: Session = Depends(get_db)):
     """Create a new clothing category"""
     
     # Check if category exists
@@ -192,106 +1486,151 @@ async def create_category(category: CategoryCreate, db: Session = Depends(get_db
     if existing:
         raise HTTPException(status_code=400, detail="Category already exists")
     
-    import json
     db_category = ClothingCategory(
         name=category.name,
         subcategories=json.dumps(category.subcategories)
     )
     
     db.add(db_category)
+    bump_markers(db, [CATEGORIES_MARKER])
     db.commit()
     db.refresh(db_category)
+    category_catalogue.invalidate()
     
-    return CategoryResponse(
-        id=db_category.id,
-        name=db_category.name,
-        subcategories=json.loads(db_category.subcategories or "[]"),
-        created_at=db_category.created_at
-    )
+    return category_response(db_category)
 
 @app.get("/api/categories/", response_model=List[CategoryResponse])
-async def get_categories(db: Session = Depends(get_db)):
-    """Get all categories"""
-    import json
-    categories = db.query(ClothingCategory).all()
+def get_categories(request: Request):
+    """Get all categories, served from memory with a strong ETag"""
+    body, etag = category_catalogue.get()
     
-    return [
-        CategoryResponse(
-            id=cat.id,
-            name=cat.name,
-            subcategories=json.loads(cat.subcategories or "[]"),
-            created_at=cat.created_at
-        )
-        for cat in categories
-    ]
+    # Clients revalidate on every load and get a 304 while nothing changed
+    headers = cache_headers("/api/categories/", etag)
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 @app.post("/api/upload/", response_model=ImageUploadResponse)
 async def upload_image(
     file: UploadFile = File(...),
-    user_id: str = Form(...),
-    db: Session = Depends(get_db)
+    user_id: str = Form(...)
 ):
     """Upload an image"""
     
     # Validate file
     validate_file(file)
     
-    # Generate unique image ID
-    image_id = str(uuid.uuid4())
+    # Save original image off the event loop; identical content is stored once
+    upload = await run_in_threadpool(store_upload, file.file)
     
-    # Create file paths
-    file_ext = Path(file.filename).suffix.lower()
-    file_name = f"{image_id}{file_ext}"
-    image_path = UPLOAD_DIR / "images" / file_name
-    thumbnail_name = f"{image_id}_thumb.jpg"
-    thumbnail_path = UPLOAD_DIR / "thumbnails" / thumbnail_name
+    # Save to database, committed along with other requests' writes
+    db_image, created = await commit_upload(upload, file.filename, user_id)
     
-    # Save original image
-    with open(image_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    # New content gets its thumbnail rendered in the background; thumbnail_status flips to ready
+    if created:
+        schedule_thumbnail(str(UPLOAD_DIR / "images" / db_image.file_name), db_image.thumbnail_path)
     
-    # Get image dimensions
-    with Image.open(image_path) as img:
-        width, height = img.size
+    return build_upload_response(db_image)
+
+@app.post("/api/upload/batch/", response_model=BatchUploadResponse)
+async def upload_images(
+    files: List[UploadFile] = File(...),
+    user_id: str = Form(...)
+):
+    """Upload several images at once, e.g. all photos of a listing"""
     
-    # Create thumbnail
-    create_thumbnail(str(image_path), str(thumbnail_path))
+    if len(files) > MAX_BATCH_FILES:
+        raise HTTPException(status_code=400, detail=f"Too many files (max {MAX_BATCH_FILES})")
     
-    # Save to database
-    db_image = ImageMetadata(
-        image_id=image_id,
-        original_name=file.filename,
-        file_name=file_name,
-        file_size=file.size,
-        width=width,
-        height=height,
-        thumbnail_path=thumbnail_name,
-        uploaded_by=user_id
-    )
+    async def ingest(file: UploadFile) -> StoredUpload:
+        validate_file(file)
+        return await run_in_threadpool(store_upload, file.file)
     
-    db.add(db_image)
-    db.commit()
-    db.refresh(db_image)
+    # Store all files concurrently, a bad file only fails its own result
+    stored = await asyncio.gather(*(ingest(f) for f in files), return_exceptions=True)
     
-    return ImageUploadResponse(
-        image_id=image_id,
-        original_name=file.filename,
-        file_size=file.size,
-        dimensions={"width": width, "height": height},
-        url=f"/uploads/images/{file_name}",
-        thumbnail_url=f"/uploads/thumbnails/{thumbnail_name}"
+    async def record(file: UploadFile, upload) -> tuple:
+        if isinstance(upload, Exception):
+            raise upload
+        return await commit_upload(upload, file.filename, user_id)
+    
+    # Each image is its own write, so the queue commits them together and a
+    # failed insert only fails its own result
+    records = await asyncio.gather(*(record(f, u) for f, u in zip(files, stored)), return_exceptions=True)
+    
+    results = []
+    for file, record in zip(files, records):
+        if isinstance(record, HTTPException):
+            results.append(BatchUploadResult(original_name=file.filename, success=False, error=record.detail))
+        elif isinstance(record, Exception):
+            print(f"Error storing upload: {record}")
+            results.append(BatchUploadResult(original_name=file.filename, success=False, error="Upload failed"))
+        else:
+            db_image, created = record
+            if created:
+                schedule_thumbnail(str(UPLOAD_DIR / "images" / db_image.file_name), db_image.thumbnail_path)
+            results.append(BatchUploadResult(
+                original_name=db_image.original_name,
+                success=True,
+                image=build_upload_response(db_image)
+            ))
+    
+    uploaded = sum(1 for r in results if r.success)
+    return BatchUploadResponse(uploaded=uploaded, failed=len(results) - uploaded, results=results)
+
+@app.get("/api/images/{image_id}")
+async def get_resized_image(
+    image_id: str,
+    w: Optional[int] = None,
+    h: Optional[int] = None,
+    fmt: str = "webp",
+    db: Session = Depends(get_db)
+):
+    """Get an image resized to fit in w x h, generated on first request"""
+    
+    if fmt not in DERIVATIVE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Invalid format, use one of: {', '.join(DERIVATIVE_FORMATS)}")
+    for value in (w, h):
+        if value is not None and not 0 < value <= MAX_DERIVATIVE_SIZE:
+            raise HTTPException(status_code=400, detail=f"Width and height must be between 1 and {MAX_DERIVATIVE_SIZE}")
+    
+    img = await run_in_threadpool(db.query(ImageMetadata).filter(ImageMetadata.image_id == image_id).first)
+    if not img:
+        raise HTTPException(status_code=404, detail="Image not found")
+    
+    # Never upscale; a missing dimension is still capped at MAX_DERIVATIVE_SIZE
+    width = min(w or MAX_DERIVATIVE_SIZE, img.width)
+    height = min(h or MAX_DERIVATIVE_SIZE, img.height)
+    source = str(UPLOAD_DIR / "images" / img.file_name)
+    
+    async def render(path: Path) -> int:
+        loop = asyncio.get_running_loop()
+        async with thumbnail_slots:
+            return await loop.run_in_executor(
+                thumbnail_pool, render_derivative, source, str(path), width, height, fmt
+            )
+    
+    # Variants are shared by every upload of the same content
+    try:
+        path = await derivative_cache.get(f"{Path(img.file_name).stem}_{width}x{height}.{fmt}", render)
+    except Exception as e:
+        print(f"Error resizing image: {e}")
+        raise HTTPException(status_code=500, detail="Could not resize image")
+    
+    return FileResponse(
+        path,
+        media_type=DERIVATIVE_FORMATS[fmt][1],
+        headers={"Cache-Control": "public, max-age=31536000, immutable"}
     )
 
 @app.post("/api/items/", response_model=ItemResponse)
-async def create_item(
+def create_item(
     item: ItemCreate,
     user_id: str = Form(...),
     db: Session = Depends(get_db)
 ):
     """Create a new clothing item"""
     
-    import json
-    
     # Generate unique item ID
     item_id = str(uuid.uuid4())
     
@@ -310,173 +1649,204 @@ async def create_item(
         seller_id=user_id,
         image_ids=json.dumps(item.image_ids)
     )
-    
-    db.add(db_item)
-    db.commit()
-    db.refresh(db_item)
+    write_queue.run(lambda db: db.add(db_item))
     
     # Get associated images
-    images = []
-    if item.image_ids:
-        db_images = db.query(ImageMetadata).filter(
-            ImageMetadata.image_id.in_(item.image_ids)
-        ).all()
-        
-        for img in db_images:
-            images.append({
-                "image_id": img.image_id,
-                "url": f"/uploads/images/{img.file_name}",
-                "thumbnail_url": f"/uploads/thumbnails/{img.thumbnail_path}",
-                "dimensions": {"width": img.width, "height": img.height}
-            })
-    
-    return ItemResponse(
-        id=db_item.id,
-        item_id=db_item.item_id,
-        title=db_item.title,
-        description=db_item.description,
-        price=db_item.price,
-        category=db_item.category,
-        condition=db_item.condition,
-        brand=db_item.brand,
-        size=db_item.size,
-        color=db_item.color,
-        location=db_item.location,
-        seller_id=db_item.seller_id,
-        status=db_item.status,
-        views=db_item.views,
-        created_at=db_item.created_at,
-        images=images
-    )
+    images = hydrate_images(db, [item.image_ids])[0]
+    
+    return JSONResponse(item_payload(item_row(db_item), images))
+
+@app.get("/api/items/search", response_model=List[ItemResponse])
+def search_items(
+    q: str,
+    limit: int = 20,
+    category: Optional[str] = None,
+    condition: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_read_db)
+):
+    """Search active items by title, description, brand and color.
+    
+    Accepts the same filters as GET /api/items/; results are ordered by
+    relevance and paged with the X-Next-Cursor header.
+    """
+    
+    match = build_match_query(q)
+    if not match:
+        return []
+    limit = min(max(limit, 1), ITEM_PAGE_LIMIT)
+    
+    if is_sqlite(db.get_bind()):
+        # bm25 scores are negative, lower is better; title hits weigh the most
+        score = func.bm25(literal_column("items_fts"), 10.0, 2.0, 5.0, 3.0)
+        query = item_image_query(db, score.label("score"), primary_only=True).join(items_fts, items_fts.c.rowid == ClothingItem.id).filter(
+            literal_column("items_fts").op("MATCH")(match)
+        )
+    else:
+        # No FTS5: every word must appear in one of the fields, oldest first
+        score = literal(0.0)
+        query = item_image_query(db, score.label("score"), primary_only=True)
+        for word in re.findall(r"\w+", q.lower()):
+            query = query.filter(or_(*(field.ilike(f"%{word}%") for field in SEARCH_FIELDS)))
+    query = apply_item_filters(query, category, condition, min_price, max_price)
+    
+    if cursor:
+        last_score, last_id = decode_cursor(cursor, "relevance")
+        query = query.filter(tuple_(score, ClothingItem.id) > tuple_(last_score, last_id))
+    
+    headers = {}
+    items = query.order_by(score, ClothingItem.id).limit(limit + 1).all()
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        headers["X-Next-Cursor"] = encode_cursor("relevance", last.score, last.id)
+    
+    page_images = primary_images(db, items)
+    
+    page = [item_payload(item, images) for item, images in zip(items, page_images)]
+    return JSONResponse(page, headers=headers)
 
 @app.get("/api/items/{item_id}", response_model=ItemResponse)
-async def get_item(item_id: str, db: Session = Depends(get_db)):
-    """Get a specific item"""
+def get_item(item_id: str, request: Request, db: Session = Depends(get_read_db)):
+    """Get a specific item, or 304 if the client's copy is still current"""
+    route = "/api/items/{item_id}"
     
-    import json
+    # Revalidation of a known item never reaches the database
+    cached = content_versions.item(item_id)
+    if cached and is_not_modified(request, *cached):
+        view_counter.record(item_id)
+        return Response(status_code=304, headers=cache_headers(route, *cached))
     
-    item = db.query(ClothingItem).filter(ClothingItem.item_id == item_id).first()
-    if not item:
+    generation = content_versions.generation
+    # The item and all its images in one query, one row per image
+    rows = item_image_query(db).filter(ClothingItem.item_id == item_id).order_by(ItemImage.position).all()
+    if not rows:
         raise HTTPException(status_code=404, detail="Item not found")
+    item = rows[0]
     
-    # Increment views
-    item.views += 1
-    db.commit()
+    # Count the view; it is written back in bulk by the view counter
+    view_counter.record(item_id)
     
-    # Get images
-    images = []
-    image_ids = json.loads(item.image_ids or "[]")
-    if image_ids:
-        db_images = db.query(ImageMetadata).filter(
-            ImageMetadata.image_id.in_(image_ids)
-        ).all()
-        
-        for img in db_images:
-            images.append({
-                "image_id": img.image_id,
-                "url": f"/uploads/images/{img.file_name}",
-                "thumbnail_url": f"/uploads/thumbnails/{img.thumbnail_path}",
-                "dimensions": {"width": img.width, "height": img.height}
-            })
-    
-    return ItemResponse(
-        id=item.id,
-        item_id=item.item_id,
-        title=item.title,
-        description=item.description,
-        price=item.price,
-        category=item.category,
-        condition=item.condition,
-        brand=item.brand,
-        size=item.size,
-        color=item.color,
-        location=item.location,
-        seller_id=item.seller_id,
-        status=item.status,
-        views=item.views,
-        created_at=item.created_at,
-        images=images
-    )
+    images = item_images(db, rows)
+    
+    result = item_payload(item, images)
+    etag = item_etag(result)
+    last_modified = item.updated_at or item.created_at
+    # A pending thumbnail changes the payload without an item write
+    if all(image["thumbnail_status"] != "pending" for image in images):
+        content_versions.remember(item_id, etag, last_modified, generation)
+    
+    headers = cache_headers(route, etag, last_modified)
+    if is_not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(result, headers=headers)
 
 @app.get("/api/items/", response_model=List[ItemResponse])
-async def get_items(
+def get_items(
+    request: Request,
     skip: int = 0,
     limit: int = 20,
     category: Optional[str] = None,
     condition: Optional[str] = None,
     min_price: Optional[float] = None,
     max_price: Optional[float] = None,
-    db: Session = Depends(get_db)
+    sort: str = "newest",
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_read_db)
 ):
-    """Get items with basic filtering"""
+    """Get items with basic filtering.
     
-    import json
+    Pass the X-Next-Cursor header of a response back as `cursor` to fetch
+    the next page; `skip` is only honoured for the first page.
+    """
     
-    query = db.query(ClothingItem).filter(ClothingItem.status == 'active')
+    limit = min(max(limit, 1), ITEM_PAGE_LIMIT)
     
-    if category:
-        query = query.filter(ClothingItem.category == category)
-    if condition:
-        query = query.filter(ClothingItem.condition == condition)
-    if min_price is not None:
-        query = query.filter(ClothingItem.price >= min_price)
-    if max_price is not None:
-        query = query.filter(ClothingItem.price <= max_price)
+    # Normalized page parameters; the category comes first for invalidation
+    params = (category or None, condition or None, min_price, max_price, sort, cursor,
+              0 if cursor else skip, limit)
     
-    items = query.offset(skip).limit(limit).all()
+    # The page's ETag depends only on its parameters and the catalogue version
+    version, last_modified = catalogue_version(db, params[0])
+    headers = cache_headers("/api/items/", list_etag(version, params), last_modified)
+    if is_not_modified(request, headers["ETag"], last_modified):
+        return Response(status_code=304, headers=headers)
     
-    result = []
-    for item in items:
-        # Get first image as thumbnail
-        images = []
-        image_ids = json.loads(item.image_ids or "[]")
-        if image_ids:
-            db_image = db.query(ImageMetadata).filter(
-                ImageMetadata.image_id == image_ids[0]
-            ).first()
-            if db_image:
-                images.append({
-                    "image_id": db_image.image_id,
-                    "url": f"/uploads/images/{db_image.file_name}",
-                    "thumbnail_url": f"/uploads/thumbnails/{db_image.thumbnail_path}",
-                    "dimensions": {"width": db_image.width, "height": db_image.height}
-                })
-        
-        result.append(ItemResponse(
-            id=item.id,
-            item_id=item.item_id,
-            title=item.title,
-            description=item.description,
-            price=item.price,
-            category=item.category,
-            condition=item.condition,
-            brand=item.brand,
-            size=item.size,
-            color=item.color,
-            location=item.location,
-            seller_id=item.seller_id,
-            status=item.status,
-            views=item.views,
-            created_at=item.created_at,
-            images=images
-        ))
-    
-    return result
+    cached = list_page_cache.get(params, version)
+    if cached is None:
+        generation = list_page_cache.generation
+        body, next_cursor = build_item_page(db, params)
+        list_page_cache.put(params, version, body, next_cursor, generation)
+    else:
+        body, next_cursor = cached
+    
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    return Response(content=body, media_type="application/json", headers=headers)
 
 @app.get("/health")
 async def health_check():
     """Health check"""
-    return {"status": "ok", "timestamp": datetime.utcnow()}
+    return {
+        "status": "ok", "timestamp": datetime.utcnow(),
+        "list_cache": list_page_cache.stats(), "write_queue": write_queue.stats()
+    }
 
 # ==================== INITIALIZE DEFAULT DATA ====================
 
+@app.on_event("startup")
+async def start_write_queue():
+    write_queue.start()
+
+@app.on_event("startup")
+async def start_view_counter():
+    view_counter.start()
+
+@app.on_event("startup")
+async def start_item_image_backfill():
+    item_image_backfill.start()
+
+@app.on_event("shutdown")
+async def stop_view_counter():
+    """Write pending view counts before exiting"""
+    view_counter.stop()
+
+@app.on_event("shutdown")
+async def stop_write_queue():
+    """Commit writes still queued before exiting"""
+    write_queue.stop()
+
+@app.on_event("startup")
+async def start_thumbnail_workers():
+    """Start the worker pool and requeue thumbnails interrupted by a restart"""
+    global thumbnail_pool
+    thumbnail_pool = ProcessPoolExecutor(max_workers=THUMBNAIL_WORKERS)
+    derivative_cache.load()
+    
+    db = SessionLocal()
+    try:
+        pending = db.query(ImageMetadata.file_name, ImageMetadata.thumbnail_path).filter(
+            ImageMetadata.thumbnail_status == "pending"
+        ).distinct().all()
+        for file_name, thumbnail_name in pending:
+            schedule_thumbnail(str(UPLOAD_DIR / "images" / file_name), thumbnail_name)
+    finally:
+        db.close()
+
+@app.on_event("shutdown")
+async def stop_thumbnail_workers():
+    """Let queued thumbnails finish, anything left is requeued on startup"""
+    if thumbnail_tasks:
+        await asyncio.wait(thumbnail_tasks, timeout=30)
+    thumbnail_pool.shutdown(wait=True)
+
 @app.on_event("startup")
 async def startup_event():
     """Create default categories"""
     db = SessionLocal()
     try:
-        import json
-        
         # Check if categories exist
         existing = db.query(ClothingCategory).count()
         if existing == 0:
@@ -495,7 +1865,9 @@ async def startup_event():
                 )
                 db.add(category)
             
+            bump_markers(db, [CATEGORIES_MARKER])
             db.commit()
+            category_catalogue.invalidate()
     finally:
         db.close()
 
@@ -517,6 +1889,12 @@ curl -X POST "http://localhost:8000/api/upload/" \
   -F "file=@image.jpg" \
   -F "user_id=user123"
 
+# 2b. Upload all photos of a listing at once
+curl -X POST "http://localhost:8000/api/upload/batch/" \
+  -F "files=@front.jpg" \
+  -F "files=@back.jpg" \
+  -F "user_id=user123"
+
 # 3. Create a category
 curl -X POST "http://localhost:8000/api/categories/" \
   -H "Content-Type: application/json" \
@@ -541,4 +1919,13 @@ curl -X POST "http://localhost:8000/api/items/" \
 
 # 5. Get items
 curl "http://localhost:8000/api/items/?category=Tops&min_price=20&max_price=50"
+
+# 6. Search items
+curl "http://localhost:8000/api/items/search?q=denim%20jacket&max_price=50"
+
+# 7. Get a 400px wide WebP of an uploaded image
+curl "http://localhost:8000/api/images/image-id-from-upload?w=400&fmt=webp"
+
+# 8. Get the next page (cursor from the X-Next-Cursor response header)
+curl "http://localhost:8000/api/items/?category=Tops&sort=price_asc&cursor=<next-cursor>"
 """
@@ -1,8 +1,15 @@
 # Add these models to your existing database models
 
-from sqlalchemy import Column, Integer, String, DateTime, Text, Enum
-from datetime import datetime
+from sqlalchemy import Column, Integer, String, DateTime, Text, Enum, Index, update, insert, bindparam
+from sqlalchemy import func, case, event, select
+from database import upsert_insert, begin_snapshot
+from datetime import datetime, timedelta
+from bisect import bisect_left, insort
+import asyncio
 import enum
+import json
+import time
+import uuid
 
 class TransactionType(enum.Enum):
     UPLOAD = "upload"
@@ -33,6 +40,51 @@ class PointTransaction(Base):
     description = Column(String(255))
     related_item_id = Column(String(100))  # Optional: link to item
     created_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Per-user history, newest first, and ledger replays since a snapshot
+    __table_args__ = (
+        Index("ix_point_transactions_user_created", "user_id", "created_at", "id"),
+        Index("ix_point_transactions_user_id", "user_id", "id"),  # entries after a snapshot
+        Index("ix_point_transactions_created", "created_at"),  # time-windowed leaderboards
+    )
+
+class PointSnapshot(Base):
+    __tablename__ = "point_snapshots"
+    
+    # Balance of a user including every ledger entry up to last_transaction_id
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(String(100), nullable=False)
+    last_transaction_id = Column(Integer, nullable=False)
+    as_of = Column(DateTime, nullable=False)  # created_at of that last entry
+    total_points = Column(Integer, default=0)
+    uploads_count = Column(Integer, default=0)
+    redeems_count = Column(Integer, default=0)
+    swaps_count = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("ix_point_snapshots_user_as_of", "user_id", "as_of", "last_transaction_id"),
+    )
+
+class OutboxJob(Base):
+    __tablename__ = "outbox_jobs"
+    
+    # Side effect committed with the change that caused it and run later by a worker
+    id = Column(Integer, primary_key=True, index=True)
+    idempotency_key = Column(String(200), unique=True, nullable=False)
+    job_type = Column(String(50), nullable=False)
+    payload = Column(Text, nullable=False)  # JSON arguments for the handler
+    status = Column(String(20), default="pending")  # pending, done, failed
+    attempts = Column(Integer, default=0)
+    available_at = Column(DateTime, default=datetime.utcnow)  # hidden from workers until then
+    claim_token = Column(String(36))  # set by the worker currently running the job
+    last_error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    completed_at = Column(DateTime)
+    
+    __table_args__ = (
+        Index("ix_outbox_jobs_status_available", "status", "available_at"),
+    )
 
 # Pydantic models
 class UserPointsResponse(BaseModel):
@@ -49,10 +101,67 @@ class PointTransactionResponse(BaseModel):
     description: str
     created_at: datetime
 
+class BalanceResponse(BaseModel):
+    user_id: str
+    as_of: Optional[datetime]
+    total_points: int
+    uploads_count: int
+    redeems_count: int
+    swaps_count: int
+
+class LedgerVerification(BaseModel):
+    user_id: str
+    consistent: bool
+    ledger: BalanceResponse
+    stored: UserPointsResponse
+
+class PointsDrift(BaseModel):
+    user_id: str
+    stored: Optional[Dict[str, int]]  # None when the user has no balance row
+    ledger: Dict[str, int]
+
+class ReconcileReport(BaseModel):
+    users_checked: int
+    ledger_entries: int
+    drifted: int
+    repaired: int  # balances rewritten, drift that resolved itself meanwhile is left alone
+    drift: List[PointsDrift]  # first RECONCILE_REPORT_LIMIT users only
+
+class ReconcileRun(BaseModel):
+    run_id: str
+    status: str  # running, done, failed
+    repair: bool
+    started_at: datetime
+    finished_at: Optional[datetime] = None
+    report: Optional[ReconcileReport] = None
+    error: Optional[str] = None
+
+class LeaderboardEntry(BaseModel):
+    rank: int
+    user_id: str
+    total_points: int
+
 class ModifyPointsRequest(BaseModel):
     points: int
     reason: str
 
+class BulkPointsEntry(BaseModel):
+    user_id: str
+    type: str  # upload/redeem/swap/admin_bonus
+    delta: int
+    reason: str = ""
+
+class BulkPointsRequest(BaseModel):
+    admin_user_id: str
+    entries: List[BulkPointsEntry]
+
+class BulkPointsSummary(BaseModel):
+    user_id: str
+    entries: int
+    points_change: int  # including milestone bonuses
+    milestones: int
+    total_points: int
+
 # Points configuration
 POINTS_CONFIG = {
     "upload": 5,
@@ -63,23 +172,200 @@ POINTS_CONFIG = {
     "milestone_50": 50
 }
 
+# Counter bumped by each transaction type
+COUNTER_COLUMNS = {
+    TransactionType.UPLOAD: "uploads_count",
+    TransactionType.REDEEM: "redeems_count",
+    TransactionType.SWAP: "swaps_count",
+}
+
+MAX_BULK_ENTRIES = 100_000
+HISTORY_LIMIT = 200  # max transactions per history page
+SNAPSHOT_INTERVAL = 3600  # seconds between balance snapshot runs
+SNAPSHOT_MIN_ENTRIES = 100  # new ledger entries before a user gets a new snapshot
+RECONCILE_CHUNK = 5000  # users aggregated and compared per round trip
+RECONCILE_REPORT_LIMIT = 100
+RECONCILE_RUNS_KEPT = 20  # finished audits whose reports stay available
+
+BALANCE_FIELDS = ("total_points", "uploads_count", "redeems_count", "swaps_count")
+BULK_QUERY_CHUNK = 500  # user IDs per IN (...) lookup
+LEADERBOARD_LIMIT = 100  # max entries per leaderboard page
+LEADERBOARD_WINDOWS = {"week": timedelta(days=7), "month": timedelta(days=30)}
+LEADERBOARD_WINDOW_TTL = 60  # seconds a windowed ranking is reused
+LEADERBOARD_RESEED_INTERVAL = 30  # seconds between checks for balances written by other processes
+POINTS_MARKER = "points"  # last-write marker of the stored balances
+JOB_WORKERS = 2  # outbox worker coroutines
+JOB_BATCH_SIZE = 50  # jobs claimed per round trip
+JOB_VISIBILITY_TIMEOUT = 60  # seconds a claimed job stays hidden before it is retried
+JOB_MAX_ATTEMPTS = 8  # attempts before a job is marked failed
+JOB_RETRY_DELAY = 2  # seconds before the first retry, doubled for each further attempt
+JOB_POLL_INTERVAL = 1  # seconds an idle worker waits for new jobs before polling again
+
+# ==================== LEADERBOARD ====================
+
+class Leaderboard:
+    """Users ranked by points, kept sorted in memory.
+    
+    Rank and top-N lookups are a binary search / slice; an update moves a
+    single entry. `version` is the points marker of the last reseed.
+    """
+
+    def __init__(self):
+        self.version: Optional[int] = None
+        self._points: Dict[str, int] = {}
+        self._ranking: List[tuple] = []  # (-points, user_id), best first
+        self._recent: Optional[Dict[str, int]] = None  # updates applied while reseeding
+        self._lock = threading.Lock()
+
+    def load(self, rows):
+        """Replace the ranking with (user_id, points) rows"""
+        points = {user_id: total for user_id, total in rows}
+        ranking = sorted((-total, user_id) for user_id, total in points.items())
+        with self._lock:
+            self._points, self._ranking = points, ranking
+
+    def reseed(self, version: int, rows):
+        """Replace the ranking with (user_id, points) rows read under `version`.
+        
+        Updates applied while the rows are read and sorted may be newer than
+        them, so they are replayed on top.
+        """
+        with self._lock:
+            self._recent = {}
+        try:
+            points = {user_id: total for user_id, total in rows}
+            with self._lock:
+                points.update(self._recent)
+                self._recent = {}
+            ranking = sorted((-total, user_id) for user_id, total in points.items())
+            with self._lock:
+                for user_id, total_points in self._recent.items():
+                    self._move(points, ranking, user_id, total_points)
+                self._points, self._ranking, self.version = points, ranking, version
+        finally:
+            with self._lock:
+                self._recent = None
+
+    def update(self, user_id: str, total_points: int):
+        with self._lock:
+            if self._recent is not None:
+                self._recent[user_id] = total_points
+            self._move(self._points, self._ranking, user_id, total_points)
+
+    @staticmethod
+    def _move(points: Dict[str, int], ranking: List[tuple], user_id: str, total_points: int):
+        old = points.get(user_id)
+        if old == total_points:
+            return
+        if old is not None:
+            del ranking[bisect_left(ranking, (-old, user_id))]
+        points[user_id] = total_points
+        insort(ranking, (-total_points, user_id))
+
+    def rank(self, user_id: str) -> Optional[LeaderboardEntry]:
+        """1 + the number of users with strictly more points"""
+        with self._lock:
+            total = self._points.get(user_id)
+            if total is None:
+                return None
+            rank = bisect_left(self._ranking, (-total, "")) + 1
+        return LeaderboardEntry(rank=rank, user_id=user_id, total_points=total)
+
+    def top(self, limit: int, offset: int = 0) -> List[LeaderboardEntry]:
+        with self._lock:
+            page = self._ranking[offset:offset + limit]
+            # Tied users share the rank of the first of them
+            ranks = [bisect_left(self._ranking, (points, "")) + 1 for points, _ in page]
+        return [
+            LeaderboardEntry(rank=rank, user_id=user_id, total_points=-points)
+            for rank, (points, user_id) in zip(ranks, page)
+        ]
+
+leaderboard = Leaderboard()
+window_leaderboards: Dict[str, tuple] = {}  # window -> (built at, Leaderboard)
+
+def get_leaderboard(db: Session, window: str) -> Leaderboard:
+    """All-time ranking, or one built from the ledger for a recent window"""
+    if window == "all":
+        return leaderboard
+    if window not in LEADERBOARD_WINDOWS:
+        raise HTTPException(status_code=400, detail=f"Invalid window, use all, {', '.join(LEADERBOARD_WINDOWS)}")
+    
+    cached = window_leaderboards.get(window)
+    if cached and time.monotonic() - cached[0] < LEADERBOARD_WINDOW_TTL:
+        return cached[1]
+    
+    since = datetime.utcnow() - LEADERBOARD_WINDOWS[window]
+    board = Leaderboard()
+    board.load(
+        db.query(PointTransaction.user_id, func.sum(PointTransaction.points_change))
+        .filter(PointTransaction.created_at >= since)
+        .group_by(PointTransaction.user_id)
+    )
+    window_leaderboards[window] = (time.monotonic(), board)
+    return board
+
+def queue_leaderboard_update(db: Session, user_id: str, total_points: int):
+    """Apply a new balance to the leaderboard once the session commits"""
+    db.info.setdefault("leaderboard", {})[user_id] = total_points
+
+@event.listens_for(SessionLocal, "before_commit")
+def record_leaderboard_updates(session):
+    # Other processes reseed their ranking once they see the marker move
+    if session.in_nested_transaction():
+        return
+    if session.info.get("leaderboard"):
+        bump_markers(session, [POINTS_MARKER])
+
+@event.listens_for(SessionLocal, "after_commit")
+def apply_leaderboard_updates(session):
+    if session.in_nested_transaction():
+        return
+    for user_id, total_points in session.info.pop("leaderboard", {}).items():
+        leaderboard.update(user_id, total_points)
+
+@event.listens_for(SessionLocal, "after_rollback")
+def discard_leaderboard_updates(session):
+    if session.in_nested_transaction():
+        return
+    session.info.pop("leaderboard", None)
+
 # Helper functions
 def get_user_points(db: Session, user_id: str) -> UserPoints:
-    """Get or create user points record"""
+    """Get user points record, an unsaved empty one if the user has none yet"""
     user_points = db.query(UserPoints).filter(UserPoints.user_id == user_id).first()
     if not user_points:
-        user_points = UserPoints(user_id=user_id)
-        db.add(user_points)
-        db.commit()
-        db.refresh(user_points)
+        user_points = UserPoints(
+            user_id=user_id, total_points=0, uploads_count=0, redeems_count=0, swaps_count=0
+        )
     return user_points
 
 def add_points_transaction(db: Session, user_id: str, transaction_type: TransactionType, 
-                         points: int, description: str = None, item_id: str = None):
-    """Add a points transaction and update user balance"""
+                         points: int, description: str = None, item_id: str = None,
+                         commit: bool = True):
+    """Add a points transaction and update user balance.
     
-    # Get user points
-    user_points = get_user_points(db, user_id)
+    The balance row is created or incremented in SQL, so concurrent awards
+    for the same user never overwrite each other. Pass commit=False to make
+    the award part of the caller's transaction.
+    """
+    now = datetime.utcnow()
+    counter = COUNTER_COLUMNS.get(transaction_type)
+    
+    # Create the balance row or apply the change to it in one statement
+    new_row = {
+        "user_id": user_id, "total_points": points, "uploads_count": 0,
+        "redeems_count": 0, "swaps_count": 0, "created_at": now, "updated_at": now
+    }
+    increments = {"total_points": UserPoints.total_points + points, "updated_at": now}
+    if counter:
+        new_row[counter] = 1
+        increments[counter] = getattr(UserPoints, counter) + 1
+    
+    upsert = upsert_insert(db.get_bind(), UserPoints).values(**new_row).on_conflict_do_update(
+        index_elements=[UserPoints.user_id], set_=increments
+    ).returning(UserPoints.total_points, UserPoints.uploads_count)
+    total_points, uploads_count = db.execute(upsert).one()
     
     # Create transaction record
     transaction = PointTransaction(
@@ -91,38 +377,604 @@ def add_points_transaction(db: Session, user_id: str, transaction_type: Transact
     )
     db.add(transaction)
     
-    # Update user points
-    user_points.total_points += points
-    user_points.updated_at = datetime.utcnow()
-    
-    # Update counters
+    # Check for milestone bonuses; the upsert returned this upload's exact count
     if transaction_type == TransactionType.UPLOAD:
-        user_points.uploads_count += 1
-        # Check for milestone bonuses
-        if user_points.uploads_count in [10, 20, 50]:
-            milestone_points = POINTS_CONFIG.get(f"milestone_{user_points.uploads_count}", 0)
-            if milestone_points > 0:
-                milestone_transaction = PointTransaction(
-                    user_id=user_id,
-                    transaction_type=TransactionType.MILESTONE,
-                    points_change=milestone_points,
-                    description=f"Milestone bonus: {user_points.uploads_count} uploads"
-                )
-                db.add(milestone_transaction)
-                user_points.total_points += milestone_points
+        milestone_points = POINTS_CONFIG.get(f"milestone_{uploads_count}", 0)
+        if milestone_points > 0:
+            db.add(PointTransaction(
+                user_id=user_id,
+                transaction_type=TransactionType.MILESTONE,
+                points_change=milestone_points,
+                description=f"Milestone bonus: {uploads_count} uploads"
+            ))
+            db.execute(
+                update(UserPoints)
+                .where(UserPoints.user_id == user_id)
+                .values(total_points=UserPoints.total_points + milestone_points)
+            )
+            total_points += milestone_points
+    
+    queue_leaderboard_update(db, user_id, total_points)
+    if commit:
+        db.commit()
+    else:
+        db.flush()
+    return transaction
+
+def apply_points_bulk(db: Session, entries: List[BulkPointsEntry]) -> List[BulkPointsSummary]:
+    """Apply many awards in one transaction.
+    
+    Balances are upserted once per user and the ledger is bulk inserted.
+    Upload milestones are evaluated per user in entry order, exactly as if
+    the entries had gone through add_points_transaction one by one.
+    """
+    now = datetime.utcnow()
+    
+    # Aggregate the deltas per user, keeping entry order
+    deltas: Dict[str, Dict[str, int]] = {}
+    for entry in entries:
+        transaction_type = TransactionType(entry.type)
+        delta = deltas.setdefault(entry.user_id, {
+            "total_points": 0, "uploads_count": 0, "redeems_count": 0, "swaps_count": 0, "entries": 0
+        })
+        delta["total_points"] += entry.delta
+        delta["entries"] += 1
+        counter = COUNTER_COLUMNS.get(transaction_type)
+        if counter:
+            delta[counter] += 1
+    
+    # Create or increment every balance; this also takes the write lock, so
+    # the counts read back below cannot move under us
+    upsert = upsert_insert(db.get_bind(), UserPoints)
+    upsert = upsert.on_conflict_do_update(
+        index_elements=[UserPoints.user_id],
+        set_={
+            "total_points": UserPoints.total_points + upsert.excluded.total_points,
+            "uploads_count": UserPoints.uploads_count + upsert.excluded.uploads_count,
+            "redeems_count": UserPoints.redeems_count + upsert.excluded.redeems_count,
+            "swaps_count": UserPoints.swaps_count + upsert.excluded.swaps_count,
+            "updated_at": upsert.excluded.updated_at,
+        }
+    )
+    db.execute(upsert, [
+        {
+            "user_id": user_id, "total_points": d["total_points"], "uploads_count": d["uploads_count"],
+            "redeems_count": d["redeems_count"], "swaps_count": d["swaps_count"],
+            "created_at": now, "updated_at": now
+        }
+        for user_id, d in deltas.items()
+    ])
+    
+    balances = {}
+    user_ids = list(deltas)
+    for i in range(0, len(user_ids), BULK_QUERY_CHUNK):
+        chunk = user_ids[i:i + BULK_QUERY_CHUNK]
+        rows = db.query(UserPoints.user_id, UserPoints.total_points, UserPoints.uploads_count).filter(
+            UserPoints.user_id.in_(chunk)
+        )
+        for user_id, total_points, uploads_count in rows:
+            balances[user_id] = {"total_points": total_points, "uploads_count": uploads_count}
+    
+    # Replay the uploads from each user's previous count to find milestones
+    uploads_seen = {
+        user_id: balances[user_id]["uploads_count"] - d["uploads_count"] for user_id, d in deltas.items()
+    }
+    bonuses = {user_id: [0, 0] for user_id in deltas}  # points, milestones
+    ledger = []
+    for entry in entries:
+        transaction_type = TransactionType(entry.type)
+        ledger.append({
+            "user_id": entry.user_id,
+            "transaction_type": transaction_type,
+            "points_change": entry.delta,
+            "description": entry.reason,
+            "created_at": now
+        })
+        if transaction_type != TransactionType.UPLOAD:
+            continue
+        uploads_seen[entry.user_id] += 1
+        milestone_points = POINTS_CONFIG.get(f"milestone_{uploads_seen[entry.user_id]}", 0)
+        if milestone_points > 0:
+            ledger.append({
+                "user_id": entry.user_id,
+                "transaction_type": TransactionType.MILESTONE,
+                "points_change": milestone_points,
+                "description": f"Milestone bonus: {uploads_seen[entry.user_id]} uploads",
+                "created_at": now
+            })
+            bonuses[entry.user_id][0] += milestone_points
+            bonuses[entry.user_id][1] += 1
     
-    elif transaction_type == TransactionType.REDEEM:
-        user_points.redeems_count += 1
-    elif transaction_type == TransactionType.SWAP:
-        user_points.swaps_count += 1
+    milestone_updates = [
+        {"b_user_id": user_id, "b_points": points} for user_id, (points, _) in bonuses.items() if points
+    ]
+    if milestone_updates:
+        db.execute(
+            update(UserPoints.__table__)
+            .where(UserPoints.__table__.c.user_id == bindparam("b_user_id"))
+            .values(total_points=UserPoints.__table__.c.total_points + bindparam("b_points")),
+            milestone_updates
+        )
+    db.execute(insert(PointTransaction), ledger)
+    for user_id in deltas:
+        queue_leaderboard_update(db, user_id, balances[user_id]["total_points"] + bonuses[user_id][0])
+    db.commit()
+    
+    return [
+        BulkPointsSummary(
+            user_id=user_id,
+            entries=d["entries"],
+            points_change=d["total_points"] + bonuses[user_id][0],
+            milestones=bonuses[user_id][1],
+            total_points=balances[user_id]["total_points"] + bonuses[user_id][0]
+        )
+        for user_id, d in deltas.items()
+    ]
+
+# ==================== BALANCE SNAPSHOTS ====================
+
+def ledger_sums(query):
+    """Aggregate columns that rebuild a balance from ledger entries"""
+    return query.with_entities(
+        func.coalesce(func.sum(PointTransaction.points_change), 0),
+        func.count(case((PointTransaction.transaction_type == TransactionType.UPLOAD, 1))),
+        func.count(case((PointTransaction.transaction_type == TransactionType.REDEEM, 1))),
+        func.count(case((PointTransaction.transaction_type == TransactionType.SWAP, 1))),
+    )
+
+def balance_as_of(db: Session, user_id: str, as_of: Optional[datetime] = None) -> BalanceResponse:
+    """Balance from the latest snapshot plus the ledger entries after it"""
+    snapshots = db.query(PointSnapshot).filter(PointSnapshot.user_id == user_id)
+    entries = db.query(PointTransaction).filter(PointTransaction.user_id == user_id)
+    if as_of is not None:
+        snapshots = snapshots.filter(PointSnapshot.as_of <= as_of)
+        entries = entries.filter(PointTransaction.created_at <= as_of)
     
+    snapshot = snapshots.order_by(PointSnapshot.as_of.desc(), PointSnapshot.last_transaction_id.desc()).first()
+    if snapshot:
+        # By id only: an entry written after the snapshot can carry an earlier created_at
+        entries = entries.filter(PointTransaction.id > snapshot.last_transaction_id)
+    
+    points, uploads, redeems, swaps = ledger_sums(entries).one()
+    if snapshot:
+        points += snapshot.total_points
+        uploads += snapshot.uploads_count
+        redeems += snapshot.redeems_count
+        swaps += snapshot.swaps_count
+    
+    return BalanceResponse(
+        user_id=user_id, as_of=as_of, total_points=points,
+        uploads_count=uploads, redeems_count=redeems, swaps_count=swaps
+    )
+
+def take_balance_snapshots(db: Session) -> int:
+    """Snapshot every user with SNAPSHOT_MIN_ENTRIES ledger entries since their last one.
+    
+    Only users with entries past the previous run's high-water id can have
+    crossed the threshold since, so a run reads the new part of the ledger
+    and, for those users only, the entries after their last snapshot. Each
+    new snapshot is the previous one plus those entries. Returns snapshots taken.
+    """
+    high_water = get_marker(db, "snapshot_high_water", 0)
+    new_high_water = db.query(func.max(PointTransaction.id)).scalar() or 0
+    active = [
+        user_id for (user_id,) in db.query(PointTransaction.user_id).filter(
+            PointTransaction.id > high_water, PointTransaction.id <= new_high_water
+        ).distinct()
+    ]
+    
+    taken = 0
+    for i in range(0, len(active), BULK_QUERY_CHUNK):
+        chunk = active[i:i + BULK_QUERY_CHUNK]
+        last_ids = dict(
+            db.query(PointSnapshot.user_id, func.max(PointSnapshot.last_transaction_id))
+            .filter(PointSnapshot.user_id.in_(chunk)).group_by(PointSnapshot.user_id)
+        )
+        
+        for user_id in chunk:
+            previous_id = last_ids.get(user_id)
+            # One range of the (user_id, id) index: the entries since the last snapshot
+            points, uploads, redeems, swaps, entries, last_id, as_of = ledger_sums(
+                db.query(PointTransaction).filter(
+                    PointTransaction.user_id == user_id,
+                    PointTransaction.id > (previous_id or 0),
+                    PointTransaction.id <= new_high_water
+                )
+            ).add_columns(
+                func.count(PointTransaction.id), func.max(PointTransaction.id), func.max(PointTransaction.created_at)
+            ).one()
+            if entries < SNAPSHOT_MIN_ENTRIES:
+                continue
+            
+            if previous_id is not None:
+                previous = db.query(PointSnapshot).filter(
+                    PointSnapshot.user_id == user_id, PointSnapshot.last_transaction_id == previous_id
+                ).first()
+                points += previous.total_points
+                uploads += previous.uploads_count
+                redeems += previous.redeems_count
+                swaps += previous.swaps_count
+                # It covers the previous snapshot's entries too
+                as_of = max(as_of, previous.as_of)
+            db.add(PointSnapshot(
+                user_id=user_id, last_transaction_id=last_id, as_of=as_of, total_points=points,
+                uploads_count=uploads, redeems_count=redeems, swaps_count=swaps
+            ))
+            taken += 1
+    
+    set_marker(db, "snapshot_high_water", new_high_water)
     db.commit()
-    return transaction
+    return taken
+
+async def snapshot_loop():
+    while True:
+        await asyncio.sleep(SNAPSHOT_INTERVAL)
+        db = SessionLocal()
+        try:
+            await run_in_threadpool(take_balance_snapshots, db)
+        except Exception as e:
+            print(f"Error taking balance snapshots: {e}")
+        finally:
+            db.close()
+
+snapshot_task: Optional[asyncio.Task] = None
+
+@app.on_event("startup")
+async def start_snapshots():
+    global snapshot_task
+    snapshot_task = asyncio.create_task(snapshot_loop())
+
+@app.on_event("shutdown")
+async def stop_snapshots():
+    if snapshot_task is not None:
+        snapshot_task.cancel()
+
+# ==================== RECONCILIATION ====================
+
+def reconcile_user_points(db: Session, repair: bool = False) -> ReconcileReport:
+    """Rebuild every balance from the ledger and compare it with UserPoints.
+    
+    The ledger is aggregated by a single GROUP BY pass that is streamed in
+    chunks, so memory only grows with the number of drifted users. The
+    audit reads one snapshot; with repair=True the drifted users are
+    recomputed and overwritten through the write queue, one write per
+    chunk so other writes are not held up for the whole repair.
+    """
+    begin_snapshot(db)
+    drift = []
+    users_checked = 0
+    ledger_entries = 0
+    
+    aggregates = ledger_sums(db.query(PointTransaction)).add_columns(
+        PointTransaction.user_id, func.count(PointTransaction.id)
+    ).group_by(PointTransaction.user_id).order_by(PointTransaction.user_id).yield_per(RECONCILE_CHUNK)
+    
+    def compare(chunk):
+        stored = {
+            row.user_id: row for row in
+            db.query(UserPoints).filter(UserPoints.user_id.in_([user_id for user_id, _ in chunk]))
+        }
+        for user_id, ledger in chunk:
+            row = stored.get(user_id)
+            current = {f: getattr(row, f) for f in BALANCE_FIELDS} if row else None
+            if current != ledger:
+                drift.append(PointsDrift(user_id=user_id, stored=current, ledger=ledger))
+    
+    chunk = []
+    for points, uploads, redeems, swaps, user_id, entries in aggregates:
+        chunk.append((user_id, dict(zip(BALANCE_FIELDS, (points, uploads, redeems, swaps)))))
+        users_checked += 1
+        ledger_entries += entries
+        if len(chunk) == RECONCILE_CHUNK:
+            compare(chunk)
+            chunk = []
+    if chunk:
+        compare(chunk)
+    
+    # Balances without a single ledger entry should all be zero
+    no_ledger = db.query(UserPoints).filter(
+        ~db.query(PointTransaction.id).filter(PointTransaction.user_id == UserPoints.user_id).exists()
+    ).yield_per(RECONCILE_CHUNK)
+    zero = dict.fromkeys(BALANCE_FIELDS, 0)
+    for row in no_ledger:
+        users_checked += 1
+        current = {f: getattr(row, f) for f in BALANCE_FIELDS}
+        if current != zero:
+            drift.append(PointsDrift(user_id=row.user_id, stored=current, ledger=zero))
+    
+    db.rollback()
+    
+    repaired = 0
+    if repair:
+        user_ids = [d.user_id for d in drift]
+        for i in range(0, len(user_ids), RECONCILE_CHUNK):
+            chunk = user_ids[i:i + RECONCILE_CHUNK]
+            repaired += write_queue.run(lambda w: repair_balances(w, chunk))
+    
+    return ReconcileReport(
+        users_checked=users_checked,
+        ledger_entries=ledger_entries,
+        drifted=len(drift),
+        repaired=repaired,
+        drift=drift[:RECONCILE_REPORT_LIMIT]
+    )
+
+def repair_balances(db: Session, user_ids: List[str]) -> int:
+    """Rebuild the given balances from the ledger, returns how many were rewritten.
+    
+    Meant for the write queue with at most RECONCILE_CHUNK users: the sums
+    and the upsert share the write lock, so no award can land in between
+    and be overwritten.
+    """
+    now = datetime.utcnow()
+    zero = dict.fromkeys(BALANCE_FIELDS, 0)
+    upsert = upsert_insert(db.get_bind(), UserPoints)
+    upsert = upsert.on_conflict_do_update(
+        index_elements=[UserPoints.user_id],
+        set_={f: getattr(upsert.excluded, f) for f in BALANCE_FIELDS + ("updated_at",)}
+    )
+    
+    ledger = {
+        user_id: dict(zip(BALANCE_FIELDS, sums)) for *sums, user_id in
+        ledger_sums(db.query(PointTransaction)).add_columns(PointTransaction.user_id)
+        .filter(PointTransaction.user_id.in_(user_ids)).group_by(PointTransaction.user_id)
+    }
+    stored = {
+        row.user_id: {f: getattr(row, f) for f in BALANCE_FIELDS} for row in
+        db.query(UserPoints).filter(UserPoints.user_id.in_(user_ids))
+    }
+    rows = [
+        {"user_id": user_id, "created_at": now, "updated_at": now, **ledger.get(user_id, zero)}
+        for user_id in user_ids
+        if (user_id in ledger or user_id in stored) and stored.get(user_id) != ledger.get(user_id, zero)
+    ]
+    if rows:
+        db.execute(upsert, rows)
+    for row in rows:
+        queue_leaderboard_update(db, row["user_id"], row["total_points"])
+    return len(rows)
+
+reconcile_runs: "OrderedDict[str, ReconcileRun]" = OrderedDict()
+reconcile_lock = threading.Lock()
+
+def run_reconcile(run: ReconcileRun):
+    db = ReadSessionLocal()
+    try:
+        run.report = reconcile_user_points(db, run.repair)
+        run.status = "done"
+    except Exception as e:
+        print(f"Error reconciling points: {e}")
+        run.error = str(e)
+        run.status = "failed"
+    finally:
+        db.close()
+        run.finished_at = datetime.utcnow()
+
+def start_reconcile(repair: bool) -> ReconcileRun:
+    """Audit in a background thread; while one audit runs, it is returned instead of starting another"""
+    with reconcile_lock:
+        for run in reconcile_runs.values():
+            if run.status == "running":
+                return run
+        run = ReconcileRun(run_id=str(uuid.uuid4()), status="running", repair=repair, started_at=datetime.utcnow())
+        reconcile_runs[run.run_id] = run
+        while len(reconcile_runs) > RECONCILE_RUNS_KEPT:
+            reconcile_runs.popitem(last=False)
+    threading.Thread(target=run_reconcile, args=(run,), name="reconcile", daemon=True).start()
+    return run
+
+def reseed_leaderboard():
+    """Reload the all-time ranking from the stored balances if they changed since the last reseed"""
+    db = SessionLocal()
+    try:
+        version = get_marker(db, POINTS_MARKER, 0)
+        if version != leaderboard.version:
+            leaderboard.reseed(
+                version, db.query(UserPoints.user_id, UserPoints.total_points).yield_per(RECONCILE_CHUNK)
+            )
+    finally:
+        db.close()
+
+async def leaderboard_loop():
+    while True:
+        await asyncio.sleep(LEADERBOARD_RESEED_INTERVAL)
+        try:
+            await run_in_threadpool(reseed_leaderboard)
+        except Exception as e:
+            print(f"Error reseeding leaderboard: {e}")
+
+leaderboard_reseeder: Optional[asyncio.Task] = None
+
+@app.on_event("startup")
+async def load_leaderboard():
+    """Seed the in-memory ranking, then pick up balances other processes write"""
+    global leaderboard_reseeder
+    reseed_leaderboard()
+    leaderboard_reseeder = asyncio.create_task(leaderboard_loop())
+
+@app.on_event("shutdown")
+async def stop_leaderboard_reseeder():
+    if leaderboard_reseeder is not None:
+        leaderboard_reseeder.cancel()
+
+# ==================== OUTBOX ====================
+
+def points_award(user_id: str, transaction_type: TransactionType, points: int,
+                 description: str, item_id: str = None) -> dict:
+    """Arguments of one add_points_transaction call, as stored in an award_points job"""
+    return {
+        "user_id": user_id, "type": transaction_type.value, "points": points,
+        "description": description, "item_id": item_id
+    }
+
+def run_award_points(db: Session, payload: dict):
+    for award in payload["awards"]:
+        add_points_transaction(
+            db, award["user_id"], TransactionType(award["type"]), award["points"],
+            award["description"], award["item_id"], commit=False
+        )
+
+JOB_HANDLERS = {
+    "award_points": run_award_points,
+}
+
+def enqueue_job(db: Session, job_type: str, payload: dict, key: Optional[str] = None):
+    """Add an outbox job to the caller's transaction.
+    
+    The job commits or rolls back with the caller's other changes. A key
+    that was already used, by a pending or a finished job, adds nothing.
+    """
+    now = datetime.utcnow()
+    db.execute(
+        upsert_insert(db.get_bind(), OutboxJob).values(
+            idempotency_key=key or str(uuid.uuid4()), job_type=job_type, payload=json.dumps(payload),
+            status="pending", attempts=0, available_at=now, created_at=now
+        ).on_conflict_do_nothing(index_elements=[OutboxJob.idempotency_key])
+    )
+    db.info["outbox_jobs"] = True
+
+@event.listens_for(SessionLocal, "after_commit")
+def wake_outbox_workers(session):
+    if session.in_nested_transaction():
+        return
+    if session.info.pop("outbox_jobs", False):
+        outbox_workers.notify()
+
+@event.listens_for(SessionLocal, "after_rollback")
+def discard_outbox_wakeup(session):
+    if session.in_nested_transaction():
+        return
+    session.info.pop("outbox_jobs", None)
+
+def claim_jobs(db: Session, token: str, limit: int = JOB_BATCH_SIZE) -> list:
+    """Take up to `limit` due jobs, hiding them from other workers for JOB_VISIBILITY_TIMEOUT"""
+    now = datetime.utcnow()
+    due = (OutboxJob.status == "pending", OutboxJob.available_at <= now)
+    # A due job that used up its attempts lost its last claim by stalling or crashing the worker
+    db.execute(
+        update(OutboxJob)
+        .where(*due, OutboxJob.attempts >= JOB_MAX_ATTEMPTS)
+        .values(status="failed", claim_token=None,
+                last_error=f"Claim expired after {JOB_MAX_ATTEMPTS} attempts")
+        .execution_options(synchronize_session=False)
+    )
+    return db.execute(
+        update(OutboxJob)
+        .where(OutboxJob.id.in_(select(OutboxJob.id).where(*due).order_by(OutboxJob.id).limit(limit)), *due)
+        .values(
+            attempts=OutboxJob.attempts + 1, claim_token=token,
+            available_at=now + timedelta(seconds=JOB_VISIBILITY_TIMEOUT)
+        )
+        .returning(OutboxJob.id, OutboxJob.job_type, OutboxJob.payload, OutboxJob.attempts)
+        .execution_options(synchronize_session=False)
+    ).all()
+
+def complete_job(db: Session, job_id: int, token: str, job_type: str, payload: str) -> bool:
+    """Run a claimed job and mark it done in the same transaction.
+    
+    Returns False without running it when the claim expired and another
+    worker took the job over.
+    """
+    done = db.execute(
+        update(OutboxJob)
+        .where(OutboxJob.id == job_id, OutboxJob.claim_token == token, OutboxJob.status == "pending")
+        .values(status="done", claim_token=None, last_error=None, completed_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if done:
+        JOB_HANDLERS[job_type](db, json.loads(payload))
+    return bool(done)
+
+def fail_job(db: Session, job_id: int, token: str, attempts: int, error: str):
+    """Schedule a retry with exponential backoff, or give up after JOB_MAX_ATTEMPTS"""
+    values = {"claim_token": None, "last_error": error[:1000]}
+    if attempts >= JOB_MAX_ATTEMPTS:
+        values["status"] = "failed"
+    else:
+        values["available_at"] = datetime.utcnow() + timedelta(seconds=JOB_RETRY_DELAY * 2 ** (attempts - 1))
+    db.execute(
+        update(OutboxJob)
+        .where(OutboxJob.id == job_id, OutboxJob.claim_token == token)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+
+class OutboxWorkers:
+    """Coroutines draining the outbox through the write queue.
+    
+    A claimed job stays hidden for JOB_VISIBILITY_TIMEOUT. If its worker
+    crashes or stalls, the job becomes due again and is retried; the claim
+    token keeps the late worker from completing it a second time.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS):
+        self.workers = workers
+        self._tasks = []
+        self._loop = None
+        self._wakeup = None
+
+    def notify(self):
+        """Wake idle workers, safe to call from any thread"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _work(self):
+        while True:
+            self._wakeup.clear()
+            token = str(uuid.uuid4())
+            try:
+                jobs = await write_queue.run_async(lambda db: claim_jobs(db, token))
+            except Exception as e:
+                print(f"Error claiming outbox jobs: {e}")
+                jobs = []
+            if not jobs:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            
+            for job_id, job_type, payload, attempts in jobs:
+                try:
+                    await write_queue.run_async(lambda db: complete_job(db, job_id, token, job_type, payload))
+                except Exception as e:
+                    print(f"Outbox job {job_id} failed (attempt {attempts}): {e}")
+                    try:
+                        await write_queue.run_async(lambda db: fail_job(db, job_id, token, attempts, str(e)))
+                    except Exception as e:
+                        # The visibility timeout retries it all the same
+                        print(f"Error rescheduling outbox job {job_id}: {e}")
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        self._loop = None
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+outbox_workers = OutboxWorkers()
+
+@app.on_event("startup")
+async def start_outbox_workers():
+    outbox_workers.start()
+
+async def stop_outbox_workers():
+    """Jobs left unfinished are retried after the visibility timeout"""
+    await outbox_workers.stop()
+
+# Ahead of the marketplace's own shutdown hooks: the workers write through
+# write_queue, so they have to stop before it closes
+app.router.on_shutdown.insert(0, stop_outbox_workers)
 
 # API Endpoints
 
 @app.get("/api/users/{user_id}/points", response_model=UserPointsResponse)
-async def get_user_points_endpoint(user_id: str, db: Session = Depends(get_db)):
+def get_user_points_endpoint(user_id: str, db: Session = Depends(get_read_db)):
     """Get user points balance and stats"""
     user_points = get_user_points(db, user_id)
     return UserPointsResponse(
@@ -134,11 +986,32 @@ async def get_user_points_endpoint(user_id: str, db: Session = Depends(get_db)):
     )
 
 @app.get("/api/users/{user_id}/transactions", response_model=List[PointTransactionResponse])
-async def get_user_transactions(user_id: str, limit: int = 50, db: Session = Depends(get_db)):
-    """Get user's points transaction history"""
-    transactions = db.query(PointTransaction).filter(
-        PointTransaction.user_id == user_id
-    ).order_by(PointTransaction.created_at.desc()).limit(limit).all()
+def get_user_transactions(
+    user_id: str,
+    response: Response,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_read_db)
+):
+    """Get user's points transaction history, newest first.
+    
+    Pass the X-Next-Cursor header back as `cursor` for older entries.
+    """
+    limit = min(max(limit, 1), HISTORY_LIMIT)
+    query = db.query(PointTransaction).filter(PointTransaction.user_id == user_id)
+    if cursor:
+        created_at, last_id = decode_cursor(cursor, "history")
+        query = query.filter(
+            tuple_(PointTransaction.created_at, PointTransaction.id) < tuple_(created_at, last_id)
+        )
+    
+    transactions = query.order_by(
+        PointTransaction.created_at.desc(), PointTransaction.id.desc()
+    ).limit(limit + 1).all()
+    if len(transactions) > limit:
+        transactions = transactions[:limit]
+        last = transactions[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor("history", last.created_at, last.id)
     
     return [
         PointTransactionResponse(
@@ -151,12 +1024,56 @@ async def get_user_transactions(user_id: str, limit: int = 50, db: Session = Dep
         for t in transactions
     ]
 
+@app.get("/api/leaderboard", response_model=List[LeaderboardEntry])
+def get_top_users(window: str = "all", limit: int = 10, offset: int = 0, db: Session = Depends(get_read_db)):
+    """Top earners, all time or over the last week/month"""
+    limit = min(max(limit, 1), LEADERBOARD_LIMIT)
+    return get_leaderboard(db, window).top(limit, max(offset, 0))
+
+@app.get("/api/leaderboard/{user_id}", response_model=LeaderboardEntry)
+def get_user_rank(user_id: str, window: str = "all", db: Session = Depends(get_read_db)):
+    """A user's rank, all time or over the last week/month"""
+    entry = get_leaderboard(db, window).rank(user_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="User has no points")
+    return entry
+
+@app.get("/api/users/{user_id}/balance", response_model=BalanceResponse)
+def get_user_balance(user_id: str, as_of: Optional[datetime] = None, db: Session = Depends(get_read_db)):
+    """Balance rebuilt from the ledger, optionally as it was at `as_of`"""
+    return balance_as_of(db, user_id, as_of)
+
+@app.get("/api/users/{user_id}/points/verify", response_model=LedgerVerification)
+def verify_user_points(user_id: str, db: Session = Depends(get_read_db)):
+    """Check the stored balance and counters against the ledger"""
+    # Both reads see one snapshot, so an award committed in between is no drift
+    begin_snapshot(db)
+    ledger = balance_as_of(db, user_id)
+    stored = get_user_points(db, user_id)
+    consistent = (
+        stored.total_points == ledger.total_points
+        and stored.uploads_count == ledger.uploads_count
+        and stored.redeems_count == ledger.redeems_count
+        and stored.swaps_count == ledger.swaps_count
+    )
+    return LedgerVerification(
+        user_id=user_id,
+        consistent=consistent,
+        ledger=ledger,
+        stored=UserPointsResponse(
+            user_id=user_id,
+            total_points=stored.total_points,
+            uploads_count=stored.uploads_count,
+            redeems_count=stored.redeems_count,
+            swaps_count=stored.swaps_count
+        )
+    )
+
 @app.post("/api/users/{user_id}/points/modify")
-async def modify_user_points(
+def modify_user_points(
     user_id: str, 
     request: ModifyPointsRequest,
-    admin_user_id: str = Form(...),  # Admin authentication
-    db: Session = Depends(get_db)
+    admin_user_id: str = Form(...)  # Admin authentication
 ):
     """Admin endpoint to modify user points"""
     
@@ -164,73 +1081,104 @@ async def modify_user_points(
     if admin_user_id != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    transaction = add_points_transaction(
+    transaction = write_queue.run(lambda db: add_points_transaction(
         db, user_id, TransactionType.ADMIN_BONUS, 
-        request.points, f"Admin: {request.reason}"
-    )
+        request.points, f"Admin: {request.reason}", commit=False
+    ))
     
     return {"message": "Points modified successfully", "transaction_id": transaction.id}
 
-@app.post("/api/items/{item_id}/redeem")
-async def redeem_item(
-    item_id: str,
-    user_id: str = Form(...),
-    db: Session = Depends(get_db)
-):
-    """Redeem an item using points"""
+@app.post("/api/points/bulk", response_model=List[BulkPointsSummary])
+def bulk_award_points(request: BulkPointsRequest, db: Session = Depends(get_db)):
+    """Admin endpoint to apply many points entries in one transaction"""
     
-    # Check if user has enough points
-    user_points = get_user_points(db, user_id)
-    redeem_cost = abs(POINTS_CONFIG["redeem"])
+    # Simple admin check (implement proper auth)
+    if request.admin_user_id != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
     
-    if user_points.total_points < redeem_cost:
-        raise HTTPException(
-            status_code=400, 
-            detail=f"Insufficient points. Need {redeem_cost}, have {user_points.total_points}"
-        )
+    if len(request.entries) > MAX_BULK_ENTRIES:
+        raise HTTPException(status_code=400, detail=f"Too many entries (max {MAX_BULK_ENTRIES})")
     
-    # Get item
-    item = db.query(ClothingItem).filter(ClothingItem.item_id == item_id).first()
-    if not item:
-        raise HTTPException(status_code=404, detail="Item not found")
+    # Milestones are only ever awarded by the ledger itself
+    allowed = {t.value for t in TransactionType} - {TransactionType.MILESTONE.value}
+    for i, entry in enumerate(request.entries):
+        if entry.type not in allowed:
+            raise HTTPException(status_code=400, detail=f"Entry {i}: invalid type '{entry.type}'")
     
-    if item.status != "active":
-        raise HTTPException(status_code=400, detail="Item not available")
+    return apply_points_bulk(db, request.entries)
+
+@app.post("/api/points/reconcile", response_model=ReconcileRun, status_code=202)
+def reconcile_points(admin_user_id: str, repair: bool = False):
+    """Admin endpoint to start an audit (and optional repair) of every balance against the ledger"""
     
-    # Deduct points
-    add_points_transaction(
-        db, user_id, TransactionType.REDEEM, 
-        POINTS_CONFIG["redeem"], f"Redeemed: {item.title}", item_id
-    )
+    # Simple admin check (implement proper auth)
+    if admin_user_id != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
     
-    # Mark item as redeemed
-    item.status = "redeemed"
-    db.commit()
+    return start_reconcile(repair)
+
+@app.get("/api/points/reconcile/{run_id}", response_model=ReconcileRun)
+def get_reconcile_run(run_id: str, admin_user_id: str):
+    """Admin endpoint to poll an audit started by POST /api/points/reconcile"""
     
-    return {"message": "Item redeemed successfully", "points_spent": redeem_cost}
+    if admin_user_id != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    run = reconcile_runs.get(run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Reconciliation run not found")
+    return run
 
-# Modify existing upload endpoint to add points
-@app.post("/api/upload/", response_model=ImageUploadResponse)
-async def upload_image_with_points(
-    file: UploadFile = File(...),
-    user_id: str = Form(...),
-    db: Session = Depends(get_db)
+@app.post("/api/items/{item_id}/redeem")
+def redeem_item(
+    item_id: str,
+    user_id: str = Form(...)
 ):
-    """Upload image and earn points"""
+    """Redeem an item using points"""
+    redeem_cost = abs(POINTS_CONFIG["redeem"])
     
-    # ... existing upload logic ...
+    # Checked and applied by the single writer, so two redeems can't both spend the same points
+    def redeem(db: Session):
+        # Check if user has enough points
+        user_points = get_user_points(db, user_id)
+        
+        if user_points.total_points < redeem_cost:
+            raise HTTPException(
+                status_code=400, 
+                detail=f"Insufficient points. Need {redeem_cost}, have {user_points.total_points}"
+            )
+        
+        # Get item
+        item = db.query(ClothingItem).filter(ClothingItem.item_id == item_id).first()
+        if not item:
+            raise HTTPException(status_code=404, detail="Item not found")
+        
+        if item.status != "active":
+            raise HTTPException(status_code=400, detail="Item not available")
+        
+        # Deduct points and mark item as redeemed in one transaction
+        add_points_transaction(
+            db, user_id, TransactionType.REDEEM, 
+            POINTS_CONFIG["redeem"], f"Redeemed: {item.title}", item_id,
+            commit=False
+        )
+        item.status = "redeemed"
     
-    # Award points for upload
-    add_points_transaction(
-        db, user_id, TransactionType.UPLOAD, 
-        POINTS_CONFIG["upload"], "Uploaded new item"
-    )
+    write_queue.run(redeem)
     
-    # ... return response ...
+    return {"message": "Item redeemed successfully", "points_spent": redeem_cost}
+
+# Uploads earn points: the award job is queued in the same transaction as the
+# image row, for single and batch uploads alike
+def award_upload_points(db: Session, image: ImageMetadata):
+    award = points_award(image.uploaded_by, TransactionType.UPLOAD, POINTS_CONFIG["upload"], "Uploaded new item")
+    enqueue_job(db, "award_points", {"awards": [award]}, key=f"upload:{image.image_id}")
+
+upload_hooks.append(award_upload_points)
 
 # Modify existing item creation to include points
 @app.post("/api/items/", response_model=ItemResponse)
-async def create_item_with_points(
+def create_item_with_points(
     item: ItemCreate,
     user_id: str = Form(...),
     db: Session = Depends(get_db)
@@ -243,36 +1191,48 @@ async def create_item_with_points(
 
 # Complete swap endpoint
 @app.post("/api/swaps/{swap_id}/complete")
-async def complete_swap(
+def complete_swap(
     swap_id: str,
     user1_id: str = Form(...),
-    user2_id: str = Form(...),
-    db: Session = Depends(get_db)
+    user2_id: str = Form(...)
 ):
     """Complete a successful swap and award points"""
     
-    # Award points to both users
-    add_points_transaction(
-        db, user1_id, TransactionType.SWAP, 
-        POINTS_CONFIG["swap"], f"Completed swap: {swap_id}"
-    )
-    add_points_transaction(
-        db, user2_id, TransactionType.SWAP, 
-        POINTS_CONFIG["swap"], f"Completed swap: {swap_id}"
-    )
+    # Both users are credited by one job, so the swap is never half-credited;
+    # completing the same swap again adds no second job
+    awards = [
+        points_award(user_id, TransactionType.SWAP, POINTS_CONFIG["swap"], f"Completed swap: {swap_id}")
+        for user_id in (user1_id, user2_id)
+    ]
+    write_queue.run(lambda db: enqueue_job(db, "award_points", {"awards": awards}, key=f"swap:{swap_id}"))
     
-    return {"message": "Swap completed, points awarded"}
+    return {"message": "Swap completed, points will be awarded shortly"}
 
 # Update tables creation
 Base.metadata.create_all(bind=engine)
+upgrade_schema()
 
 # Usage Examples:
 """
 # Get user points
 GET /api/users/user123/points
 
-# Get transaction history
+# Get transaction history (older pages: cursor from the X-Next-Cursor header)
 GET /api/users/user123/transactions?limit=20
+GET /api/users/user123/transactions?limit=20&cursor=<next-cursor>
+
+# Leaderboard: top 10 all time, this month, and one user's weekly rank
+GET /api/leaderboard?limit=10
+GET /api/leaderboard?window=month
+GET /api/leaderboard/user123?window=week
+
+# Audit every balance against the ledger, then fix the drifted ones
+POST /api/points/reconcile?admin_user_id=admin
+POST /api/points/reconcile?admin_user_id=admin&repair=true
+
+# Balance at a point in time, and a check of the stored balance against the ledger
+GET /api/users/user123/balance?as_of=2024-06-30T23:59:59
+GET /api/users/user123/points/verify
 
 # Redeem an item
 POST /api/items/item456/redeem
@@ -286,4 +1246,11 @@ JSON: {"points": 50, "reason": "Bonus for good behavior"}
 # Complete swap
 POST /api/swaps/swap789/complete
 Form: user1_id=user123&user2_id=user456
+
+# Bulk award (end-of-day settlement, promotions)
+POST /api/points/bulk
+JSON: {"admin_user_id": "admin", "entries": [
+    {"user_id": "user123", "type": "swap", "delta": 2, "reason": "Swap swap789"},
+    {"user_id": "user456", "type": "admin_bonus", "delta": 20, "reason": "Spring promo"}
+]}
 """